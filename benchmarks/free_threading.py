@@ -0,0 +1,61 @@
+# Images/s of whole-image rendering on a thread pool for 1..N workers.
+# Run it on a regular and a free-threaded interpreter to compare scaling:
+#   python -m benchmarks.free_threading
+#   python3.13t -X gil=0 -m benchmarks.free_threading
+
+import argparse
+import os
+import sys
+import sysconfig
+import time
+import cv2
+import numpy as np
+from processing.pipeline import make_recipe, render
+from processing.parallel import ImagePool, gil_enabled, image_workers
+from benchmarks.sample import sample_image
+
+def test_images(count, width, height):
+    image = sample_image(width, height)
+    # Distinct arrays, as a batch would have
+    return [cv2.add(image, i % 16) for i in range(count)]
+
+def time_pool(images, recipe, workers, repeat):
+    with ImagePool(workers) as pool:
+        pool.map(render, images[:workers], recipe)
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results = pool.map(render, images, recipe)
+            best = min(best, time.perf_counter() - start)
+        return best, results
+
+def main():
+    parser = argparse.ArgumentParser(description="Thread pool scaling, GIL vs free-threaded")
+    parser.add_argument("--count", type=int, default=64)
+    parser.add_argument("--size", default="320x240",
+                        help="small images make the Python share of the work visible")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split("x"))
+    images = test_images(args.count, width, height)
+    recipe = make_recipe(gaussian=10, darken=10, brighten=20, grayscale=True,
+                         background="simple")
+
+    build = "free-threaded" if sysconfig.get_config_var("Py_GIL_DISABLED") else "default"
+    print(f"Python {sys.version.split()[0]} ({build} build), GIL {'on' if gil_enabled() else 'off'}, "
+          f"{os.cpu_count()} cores, default workers {image_workers()}")
+    print(f"{args.count} images of {width}x{height}")
+    print("workers    images/s    speedup    matches serial")
+    baseline = None
+    reference = None
+    for workers in range(1, args.max_workers + 1):
+        seconds, results = time_pool(images, recipe, workers, args.repeat)
+        if baseline is None:
+            baseline, reference = seconds, results
+        same = all(np.array_equal(a, b) for a, b in zip(results, reference))
+        print(f"{workers:7d}    {args.count / seconds:8.1f}    {baseline / seconds:6.2f}x    {same}")
+
+if __name__ == "__main__":
+    main()
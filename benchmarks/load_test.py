@@ -0,0 +1,68 @@
+# Load test for the render service: p50/p99 latency and requests/s.
+# Start the service first (python main.py --serve), then from the repo root:
+#   python -m benchmarks.load_test --concurrency 8 --requests 200
+
+import argparse
+import http.client
+import threading
+import time
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+def client(host, port, path, body, count, latencies, statuses, lock):
+    # One keep-alive connection per client thread
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    for _ in range(count):
+        start = time.perf_counter()
+        conn.request("POST", path, body, {"Content-Type": "application/octet-stream"})
+        response = conn.getresponse()
+        response.read()
+        elapsed = time.perf_counter() - start
+        with lock:
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+            if response.status == 200:
+                latencies.append(elapsed)
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Render service load test")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--image", default="image/happy.jpg")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--params", default="gaussian=20&brighten=10&format=jpg",
+                        help="query string of recipe values")
+    args = parser.parse_args()
+
+    with open(args.image, "rb") as f:
+        body = f.read()
+    path = "/render?" + args.params
+
+    latencies, statuses, lock = [], {}, threading.Lock()
+    per_client = max(1, args.requests // args.concurrency)
+    threads = [threading.Thread(target=client, args=(args.host, args.port, path, body,
+                                                     per_client, latencies, statuses, lock))
+               for _ in range(args.concurrency)]
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    total = sum(statuses.values())
+    print(f"{total} requests, concurrency {args.concurrency}, {elapsed:.2f} s")
+    print(f"status codes: {dict(sorted(statuses.items()))}")
+    print(f"throughput: {len(latencies) / elapsed:.1f} req/s (200 only)")
+    print(f"latency p50: {percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p99: {percentile(latencies, 99) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
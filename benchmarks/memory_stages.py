@@ -0,0 +1,58 @@
+# Peak memory of every render stage (numpy buffers and tracemalloc), and
+# what the memory budget does to the peak, the time and the pixels:
+#   python -m benchmarks.memory_stages --size 8000x6000 --budget-mb 400
+
+import argparse
+import time
+import cv2
+import numpy as np
+from processing.pipeline import make_recipe, render
+from processing.memory import MemoryStats
+from benchmarks.sample import sample_image
+
+def area(shape):
+    # Feathered box over most of the frame, the worst case for the blend
+    h, w = shape[:2]
+    mask = np.zeros((h, w), np.uint8)
+    mask[h // 10:h * 9 // 10, w // 10:w * 9 // 10] = 255
+    return cv2.GaussianBlur(mask, (0, 0), max(1, w // 200))
+
+def measure(image, recipe, budget):
+    with MemoryStats() as memory:
+        start = time.perf_counter()
+        result = render(image, recipe, memory=memory, budget=budget)
+        seconds = time.perf_counter() - start
+    return result, memory, seconds
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage peak memory and the budget guard")
+    parser.add_argument("--size", default="6000x4000")
+    parser.add_argument("--budget-mb", type=int, default=256)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split("x"))
+    image = sample_image(width, height, cv2.INTER_CUBIC)
+    mask = area(image.shape)
+    recipes = {
+        "selective": make_recipe(gaussian=6, brighten=10,
+                                 masks=[{'mask': mask, 'blur_type': 'gaussian', 'intensity': 50}]),
+        "lens": make_recipe(masks=[{'mask': mask, 'blur_type': 'lens', 'intensity': 80}]),
+        "edge + binary": make_recipe(median=8, background="edge", binary=True),
+    }
+    budget = args.budget_mb * 2**20
+    print(f"{width}x{height}, source {image.nbytes / 2**20:.0f} MB, budget {args.budget_mb} MB")
+
+    for name, recipe in recipes.items():
+        expected, memory, seconds = measure(image, recipe, None)
+        print(f"\n{name}: estimate {memory.estimate / 2**20:.0f} MB, {seconds * 1e3:.0f} ms")
+        print("  stage                     arrays MB   traced MB")
+        for stage, (arrays, traced) in memory.stages.items():
+            print(f"  {stage:24s} {arrays / 2**20:10.0f}  {traced / 2**20:10.0f}")
+
+        result, guarded, seconds = measure(image, recipe, budget)
+        diff = cv2.absdiff(result, expected)
+        print(f"  with budget: {guarded.summary()}, {seconds * 1e3:.0f} ms, "
+              f"max pixel difference {int(diff.max())}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Speedup of the band-parallel renderer for 1..N worker threads.
+# Run from the repo root: python -m benchmarks.parallel_speedup [--size 6000x4000]
+
+import argparse
+import os
+import time
+import cv2
+import numpy as np
+from processing.pipeline import make_recipe, render
+from processing.parallel import BandExecutor
+from benchmarks.sample import sample_image
+
+def test_recipe(width, height):
+    # Global blur, two selective areas and the pointwise filters
+    masks = []
+    for blur_type, (x1, y1, x2, y2) in (("gaussian", (0.1, 0.1, 0.6, 0.9)),
+                                       ("median", (0.5, 0.2, 0.9, 0.7))):
+        mask = np.zeros((height, width), np.uint8)
+        cv2.rectangle(mask, (int(x1 * width), int(y1 * height)),
+                      (int(x2 * width), int(y2 * height)), 255, -1)
+        masks.append({'mask': mask, 'blur_type': blur_type, 'intensity': 40})
+    return make_recipe(gaussian=30, masks=masks, darken=10, brighten=20, grayscale=True)
+
+def time_render(image, recipe, workers, repeat):
+    with BandExecutor(workers) as executor:
+        render(image, recipe, executor=executor)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = render(image, recipe, executor=executor)
+        return (time.perf_counter() - start) / repeat, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Band-parallel renderer speedup")
+    parser.add_argument("--size", default="6000x4000")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split("x"))
+    image = sample_image(width, height, cv2.INTER_LINEAR)
+    recipe = test_recipe(width, height)
+
+    print(f"{width}x{height}, {os.cpu_count()} cores")
+    print("workers    seconds    speedup    matches serial")
+    baseline = None
+    reference = None
+    for workers in range(1, args.max_workers + 1):
+        seconds, result = time_render(image, recipe, workers, args.repeat)
+        if baseline is None:
+            baseline, reference = seconds, result
+        same = np.array_equal(result, reference)
+        print(f"{workers:7d}    {seconds:7.3f}    {baseline / seconds:6.2f}x    {same}")
+
+if __name__ == "__main__":
+    main()
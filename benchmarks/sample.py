@@ -0,0 +1,16 @@
+# Test photo the benchmarks share: the repo's sample image at any size, or
+# noise if it is not there
+import os
+import cv2
+import numpy as np
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      "image", "happy.jpg")
+
+def sample_image(width=None, height=None, interpolation=cv2.INTER_AREA):
+    image = cv2.imread(SAMPLE)
+    if image is None:
+        image = np.random.randint(0, 256, (480, 640, 3), np.uint8)
+    if width is None or height is None:
+        return image
+    return cv2.resize(image, (width, height), interpolation=interpolation)
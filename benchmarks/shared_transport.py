@@ -0,0 +1,48 @@
+# Pickled process pool vs shared memory frame ring for the same renders.
+# Run from the repo root: python -m benchmarks.shared_transport [--size 6000x4000]
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from processing.pipeline import make_recipe, render
+from utils.shared_frames import SharedFramePool
+from benchmarks.sample import sample_image
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame transport comparison")
+    parser.add_argument("--size", default="6000x4000")
+    parser.add_argument("--frames", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split("x"))
+    image = sample_image(width, height, cv2.INTER_LINEAR)
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+    frames = [image] * args.frames
+    recipe = make_recipe(brighten=10)
+    mb = image.nbytes / 2**20
+    print(f"{args.frames} frames of {width}x{height} BGRA ({mb:.0f} MB), "
+          f"{args.processes} processes")
+
+    with ProcessPoolExecutor(args.processes) as pool:
+        list(pool.map(render, frames[:1], [recipe]))
+        start = time.perf_counter()
+        pickled = list(pool.map(render, frames, [recipe] * len(frames)))
+        pickled_time = time.perf_counter() - start
+
+    with SharedFramePool(image.nbytes, args.processes) as pool:
+        list(pool.imap(render, frames[:1], recipe))
+        start = time.perf_counter()
+        same = all(np.array_equal(out, ref) for out, ref in
+                   zip(pool.imap(render, frames, recipe), pickled))
+        shared_time = time.perf_counter() - start
+
+    print(f"pickled:       {pickled_time:.2f} s ({args.frames / pickled_time:.1f} frames/s)")
+    print(f"shared memory: {shared_time:.2f} s ({args.frames / shared_time:.1f} frames/s), "
+          f"matches: {same}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Images/s of the stacked renderer against render() per image, for many
+# small images of one size.
+# Run from the repo root: python -m benchmarks.stacked_batch [--count 2000 --size 128x128]
+
+import argparse
+import time
+import numpy as np
+from processing.pipeline import make_recipe, render
+from processing.stacked import render_many
+from benchmarks.sample import sample_image
+
+RECIPES = {
+    "tone": dict(darken=10, brighten=25, grayscale=True, blackwhite=True, bw_threshold=110),
+    "light": dict(darken=10, brighten=25),
+    "blur+tone": dict(gaussian=12, darken=10, brighten=25, grayscale=True),
+    "median": dict(median=20, brighten=10),
+}
+
+def test_images(count, width, height):
+    rng = np.random.default_rng(0)
+    base = sample_image(width * 2, height * 2)
+    images = []
+    for _ in range(count):
+        x, y = rng.integers(0, width), rng.integers(0, height)
+        images.append(np.ascontiguousarray(base[y:y + height, x:x + width]))
+    return images
+
+def best_of(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Stacked vs per-image rendering of small images")
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--size", default="128x128")
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+    images = test_images(args.count, width, height)
+
+    print(f"{args.count} images of {width}x{height}")
+    print(f"{'recipe':>10} {'per image':>12} {'stacked':>12} {'speedup':>8}  same")
+    for name, values in RECIPES.items():
+        recipe = make_recipe(**values)
+
+        single_time, single = best_of(lambda: [render(image, recipe) for image in images])
+        stacked_time, stacked = best_of(lambda: render_many(images, recipe))
+        single_rate = len(images) / single_time
+        stacked_rate = len(images) / stacked_time
+
+        same = all(np.array_equal(a, b) for a, b in zip(single, stacked))
+        print(f"{name:>10} {single_rate:>10.0f}/s {stacked_rate:>10.0f}/s "
+              f"{stacked_rate / single_rate:>7.1f}x  {same}")
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,163 @@
 # NUR AIFA INSYIRAH BINTI HAIRUL AZMI A23CS8005 
 # RADEN SALMA HUMAIRA BINTI MUHAMMAD MUN'IM  A23CS0264
 
-from ui.app import SnappicApp
+import argparse
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="SNAPPIC - Photo Editor")
+    parser.add_argument("--stream", nargs=2, metavar=("SOURCE", "OUTPUT"),
+                        help="process a video or frame folder into a video or frame folder")
+    parser.add_argument("--batch", nargs=2, metavar=("INPUT", "OUTPUT_DIR"),
+                        help="apply a recipe to an image or every image in a folder")
+    parser.add_argument("--export-presets", nargs=2, metavar=("IMAGE", "OUTPUT_DIR"),
+                        help="apply a recipe once and save the result at every preset size")
+    parser.add_argument("--pipe", action="store_true",
+                        help="read an encoded image from stdin, write the result to stdout")
+    parser.add_argument("--framed", action="store_true",
+                        help="with --pipe: many images, each after its 4-byte big-endian length")
+    parser.add_argument("--recipe", help="JSON file with edit parameters")
+    parser.add_argument("--queue-size", type=int, default=4,
+                        help="frames buffered between stages (default: 4)")
+    parser.add_argument("--prefetch", type=int, default=4,
+                        help="batch images waiting between read, compute and write (default: 4)")
+    parser.add_argument("--readers", type=int, default=1,
+                        help="batch reader/decoder threads (default: 1)")
+    parser.add_argument("--format",
+                        help="batch/export/pipe output extension, e.g. .png "
+                             "(default: keep, export: .jpg, pipe: .png)")
+    parser.add_argument("--memory-mb", type=int,
+                        help="RAM ceiling for batch images in flight (default: half of RAM)")
+    parser.add_argument("--render-mb", type=int,
+                        help="RAM for one render; bigger ones run in bands (default: no limit)")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="time the filters on this machine before planning a batch")
+    parser.add_argument("--serve", nargs="?", const="127.0.0.1:8080", metavar="HOST:PORT",
+                        help="run the HTTP render service (default: 127.0.0.1:8080)")
+    parser.add_argument("--workers", type=int,
+                        help="render worker threads (default: all cores, batch: half under the GIL)")
+    parser.add_argument("--max-queue", type=int,
+                        help="requests waiting for a worker before answering 503")
+    parser.add_argument("--cache-dir", help="on-disk result cache folder (serve, batch, export)")
+    parser.add_argument("--cache-mb", type=int, default=2048,
+                        help="result cache size cap in MB (default: 2048)")
+    parser.add_argument("--no-cache", action="store_true", help="disable the result cache")
+    return parser.parse_args()
+
+def open_result_cache(args):
+    if args.no_cache:
+        return None
+    from utils.result_cache import ResultCache
+    return ResultCache(args.cache_dir, args.cache_mb * 2**20)
+
+def render_budget(args):
+    return args.render_mb * 2**20 if args.render_mb else None
+
+def run_stream_mode(args):
+    from processing.pipeline import load_recipe, make_recipe
+    from processing.stream import run_stream
+
+    recipe = load_recipe(args.recipe) if args.recipe else make_recipe()
+    report = lambda s: print(f"{s.frames} frames, {s.sustained_fps:.1f} fps")
+    stats = run_stream(args.stream[0], args.stream[1], recipe, args.queue_size, report=report)
+    print(f"Done: {stats.frames} frames, {stats.fps:.1f} fps average, "
+          f"{stats.sustained_fps:.1f} fps sustained, "
+          f"masks computed {stats.masks_computed}, reused {stats.masks_reused}")
+
+def run_batch_mode(args):
+    from processing.pipeline import load_recipe, make_recipe
+    from processing.batch import run_batch, batch_sources
+    from processing.registry import calibrate
+
+    recipe = load_recipe(args.recipe) if args.recipe else make_recipe()
+    if args.calibrate:
+        calibrate()
+    paths = batch_sources(args.batch[0])
+    ext = args.format if not args.format or args.format.startswith(".") else "." + args.format
+    report = lambda s: s.written % 25 == 0 and print(f"{s.written}/{len(paths)} images")
+    memory = args.memory_mb * 2**20 if args.memory_mb else None
+    cache = open_result_cache(args)
+    stats = run_batch(paths, args.batch[1], recipe, args.prefetch, args.workers,
+                      args.readers, ext=ext, report=report, memory_limit=memory,
+                      render_budget=render_budget(args), cache=cache)
+    print(stats.summary())
+    if cache is not None:
+        print(f"Result cache: {cache.hits} hits, {cache.misses} misses")
+    for path, error in stats.failed:
+        print(f"Failed: {path}: {error}")
+
+def run_export_mode(args):
+    import os
+    import time
+    from processing.pipeline import load_recipe, make_recipe, render
+    from processing.export import export_presets, export_cached
+    from utils.image_io import load_image
+
+    recipe = load_recipe(args.recipe) if args.recipe else make_recipe()
+    source, out_dir = args.export_presets
+    stem = os.path.splitext(os.path.basename(source))[0]
+    ext = args.format if not args.format or args.format.startswith(".") else "." + args.format
+    cache = open_result_cache(args)
+    start = time.perf_counter()
+    if cache is not None:
+        # A re-export of an unchanged file and recipe only copies from the cache
+        with open(source, "rb") as f:
+            data = f.read()
+        paths = export_cached(cache, data, out_dir, stem, recipe, ext or ".jpg",
+                              workers=args.workers, budget=render_budget(args))
+    else:
+        image = load_image(source)
+        if image is None:
+            raise SystemExit(f"Could not read image: {source}")
+        result = render(image, recipe, budget=render_budget(args))
+        paths = export_presets(result, out_dir, stem, ext or ".jpg", workers=args.workers)
+    for path in paths.values():
+        print(path)
+    print(f"{len(paths)} presets in {time.perf_counter() - start:.2f}s")
+
+def run_pipe_mode(args):
+    import os
+    import sys
+    from processing.pipeline import load_recipe, make_recipe
+    from processing.pipe import run_pipe
+
+    # stdout carries the images, everything else goes to stderr
+    recipe = load_recipe(args.recipe) if args.recipe else make_recipe()
+    ext = args.format if not args.format or args.format.startswith(".") else "." + args.format
+    report = lambda s: print(f"{s.frames} images, {s.sustained_fps:.1f}/s", file=sys.stderr)
+    try:
+        stats = run_pipe(sys.stdin.buffer, sys.stdout.buffer, recipe, ext or ".png",
+                         args.framed, args.queue_size, report=report,
+                         budget=render_budget(args))
+    except (ValueError, EOFError) as e:
+        raise SystemExit(f"Pipe failed: {e}")
+    except BrokenPipeError:
+        # The reader went away; keep the exit flush from failing again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return
+    if args.framed:
+        print(f"Done: {stats.frames} images, {stats.fps:.1f}/s, {stats.failed} failed",
+              file=sys.stderr)
+
+def run_service_mode(args):
+    from service.server import serve
+
+    host, _, port = args.serve.rpartition(":")
+    serve(host or "127.0.0.1", int(port), args.workers, args.max_queue,
+          cache=open_result_cache(args))
 
 if __name__ == "__main__":
-    app = SnappicApp()
-    app.mainloop()
+    args = parse_args()
+    if args.stream:
+        run_stream_mode(args)
+    elif args.batch:
+        run_batch_mode(args)
+    elif args.export_presets:
+        run_export_mode(args)
+    elif args.pipe:
+        run_pipe_mode(args)
+    elif args.serve:
+        run_service_mode(args)
+    else:
+        from ui.app import SnappicApp
+        app = SnappicApp()
+        app.mainloop()
@@ -0,0 +1,330 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+import cv2
+from PIL import Image
+from processing.parallel import image_workers, share_cores
+from processing.memory import physical_memory
+from processing.pipeline import render
+from processing.registry import estimate_seconds
+from processing.stacked import render_many, stackable, STACK_MAX_PIXELS
+from utils.image_io import decode_image, encode_image
+from utils.result_cache import render_cached, is_png
+from utils.video_io import list_frame_files
+
+_DONE = object()
+
+# Decoded images a compute thread takes at once for a stackable recipe
+STACK_SIZE = 16
+
+class StageStats:
+    # Busy time of one stage; blocked on a queue does not count
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.start = None
+        self.end = None
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.items += 1
+            self.busy += seconds
+
+    @property
+    def utilization(self):
+        # Fraction of the run this stage's threads spent working
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.busy / max((self.end - self.start) * self.workers, 1e-9)
+
+class BatchStats:
+    def __init__(self, readers, workers, writers):
+        self.stages = {"read": StageStats("read", readers),
+                       "compute": StageStats("compute", workers),
+                       "write": StageStats("write", writers)}
+        self.written = 0
+        self.failed = []
+        self.jobs = []
+        self.gate = None
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def elapsed(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    @property
+    def images_per_sec(self):
+        return self.written / max(self.elapsed, 1e-9)
+
+    @property
+    def bottleneck(self):
+        return max(self.stages.values(), key=lambda s: s.utilization).name
+
+    def summary(self):
+        stages = ", ".join(f"{s.name} {s.utilization:.0%}" for s in self.stages.values())
+        return (f"{self.written} images in {self.elapsed:.1f}s "
+                f"({self.images_per_sec:.1f} images/s), {len(self.failed)} failed; "
+                f"busy: {stages}; bottleneck: {self.bottleneck}"
+                + (f"; peak images in flight {self.gate.peak / 2**20:.0f} MB"
+                   if self.gate is not None else ""))
+
+def batch_sources(source):
+    # A folder of images or a single file
+    if os.path.isdir(source):
+        return list_frame_files(source)
+    return [source]
+
+def output_path(path, out_dir, ext=None):
+    stem, source_ext = os.path.splitext(os.path.basename(path))
+    return os.path.join(out_dir, stem + (ext or source_ext))
+
+# Decoding cost per pixel and channel, and working copies alive per image
+# (decoded input, intermediate, result)
+DECODE_NS_PER_PX = 4.0
+WORKING_COPIES = 3
+
+class Job:
+    __slots__ = ("path", "shape", "cost", "nbytes")
+
+    def __init__(self, path, shape, cost, nbytes):
+        self.path = path
+        self.shape = shape
+        self.cost = cost
+        self.nbytes = nbytes
+
+def probe_image(path):
+    # Size from the file header only, PIL does not decode pixels on open
+    try:
+        with Image.open(path) as im:
+            width, height = im.size
+    except (OSError, ValueError):
+        return None
+    # Images are decoded to BGR for processing whatever the file holds
+    return (height, width, 3)
+
+def plan_batch(paths, recipe):
+    # Jobs sorted longest first, so a huge file starts early instead of
+    # holding up the tail of the run
+    jobs = []
+    for path in paths:
+        shape = probe_image(path)
+        if shape is None:
+            jobs.append(Job(path, None, 0.0, 0))
+            continue
+        pixels = shape[0] * shape[1] * shape[2]
+        cost = estimate_seconds(recipe, shape) + pixels * DECODE_NS_PER_PX * 1e-9
+        jobs.append(Job(path, shape, cost, pixels * WORKING_COPIES))
+    jobs.sort(key=lambda job: job.cost, reverse=True)
+    return jobs
+
+def default_memory_limit():
+    # Half the physical memory, or 4 GB when it cannot be read
+    total = physical_memory()
+    return total // 2 if total else 4 * 2**30
+
+class MemoryGate:
+    # Byte budget for the images in flight. One image bigger than the whole
+    # budget still runs, but on its own.
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, nbytes):
+        with self.cond:
+            while self.used and self.used + nbytes > self.limit:
+                self.cond.wait()
+            self.used += nbytes
+            self.peak = max(self.peak, self.used)
+
+    def release(self, nbytes):
+        with self.cond:
+            self.used -= nbytes
+            self.cond.notify_all()
+
+def _read(path):
+    # Raw bytes first, so the timed disk read and the decode are one stage
+    with open(path, "rb") as f:
+        return decode_image(f.read())
+
+def _read_cached(path):
+    # Undecoded bytes and their hash: a cache hit never decodes
+    with open(path, "rb") as f:
+        data = f.read()
+    return data, hashlib.sha256(data).hexdigest()
+
+def _write(path, result, out_dir, ext):
+    # result is an image, or bytes already encoded by the result cache
+    target = output_path(path, out_dir, ext)
+    if isinstance(result, bytes):
+        if is_png(result):
+            target = os.path.splitext(target)[0] + ".png"
+        data = result
+    else:
+        if result.shape[-1:] == (4,):
+            target = os.path.splitext(target)[0] + ".png"
+        data = encode_image(result, os.path.splitext(target)[1])
+    with open(target, "wb") as f:
+        f.write(data)
+
+def _run_stage(stats, work, inbox, outbox, failures, on_fail=None):
+    # Pull (path, payload) until the end marker, time in work() counts as busy
+    while True:
+        item = inbox.get()
+        if item is _DONE:
+            # Leave it for the other threads of this stage
+            inbox.put(_DONE)
+            return
+        path, payload = item
+        began = time.perf_counter()
+        try:
+            result = work(path, payload)
+        except Exception as e:
+            failures.append((path, str(e)))
+            result = None
+            if on_fail is not None:
+                on_fail(path)
+        stats.add(time.perf_counter() - began)
+        if result is not None and outbox is not None:
+            outbox.put((path, result))
+
+def _run_stacked_stage(stats, recipe, work, inbox, outbox, failures, on_fail, size):
+    # _run_stage for a stackable recipe: the small images already waiting (up
+    # to size) go through render_many() in one call, bigger ones through
+    # work(). If a stack fails, its images are redone one by one so only the
+    # bad one fails.
+    while True:
+        item = inbox.get()
+        if item is _DONE:
+            inbox.put(_DONE)
+            return
+        items = [item]
+        while len(items) < size:
+            try:
+                item = inbox.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                inbox.put(_DONE)
+                break
+            items.append(item)
+        began = time.perf_counter()
+        small, single = [], []
+        for path, image in items:
+            fits = image.shape[0] * image.shape[1] <= STACK_MAX_PIXELS
+            (small if fits else single).append((path, image))
+        results = []
+        if len(small) > 1:
+            try:
+                results = list(zip(small, render_many([image for _, image in small], recipe)))
+            except Exception:
+                single = items
+        else:
+            single = items
+        for path, image in single:
+            try:
+                results.append(((path, image), work(path, image)))
+            except Exception as e:
+                failures.append((path, str(e)))
+                on_fail(path)
+        seconds = (time.perf_counter() - began) / len(items)
+        for _ in items:
+            stats.add(seconds)
+        for (path, _), result in results:
+            outbox.put((path, result))
+
+def run_batch(paths, out_dir, recipe, prefetch=4, workers=None, readers=1, writers=1,
+              ext=None, report=None, memory_limit=None, schedule=True, render_budget=None,
+              cache=None):
+    # Reader, compute and writer threads joined by bounded queues, so the run
+    # takes as long as its slowest stage rather than the sum of all three.
+    # prefetch is how many images may wait between two stages. cv2 releases
+    # the GIL, so extra reader threads help when decoding is the slow part.
+    # With schedule, files go out longest first and the images in flight are
+    # kept under memory_limit bytes; render_budget caps one render (see
+    # plan_memory). With a ResultCache, files rendered with the same recipe
+    # before are copied from it. Without one, a recipe of lookup-table ops
+    # only renders small images of one size as a stack (render_many). The default worker count follows
+    # image_workers(): every core on a free-threaded build, half under the GIL.
+    workers = workers or image_workers()
+    os.makedirs(out_dir, exist_ok=True)
+    stats = BatchStats(readers, workers, writers)
+    written = threading.Lock()
+    paths_in = queue.Queue()
+    # A stackable recipe renders small images in groups, so more of them may
+    # wait for the compute threads
+    stack = cache is None and stackable(recipe)
+    decoded = queue.Queue(maxsize=max(prefetch, STACK_SIZE) if stack else prefetch)
+    rendered = queue.Queue(maxsize=prefetch)
+
+    if schedule:
+        jobs = plan_batch(paths, recipe)
+    else:
+        jobs = [Job(path, None, 0.0, 0) for path in paths]
+    stats.jobs = jobs
+    gate = MemoryGate(memory_limit or default_memory_limit())
+    stats.gate = gate
+    held = {job.path: job.nbytes for job in jobs}
+    for job in jobs:
+        paths_in.put((job.path, None))
+    paths_in.put(_DONE)
+    saved_threads = share_cores(workers)
+
+    def done(path):
+        gate.release(held.get(path, 0))
+
+    def read(path, _):
+        gate.acquire(held.get(path, 0))
+        return _read(path) if cache is None else _read_cached(path)
+
+    def compute(path, image):
+        if cache is not None:
+            data, digest = image
+            target_ext = os.path.splitext(output_path(path, out_dir, ext))[1]
+            return render_cached(cache, lambda: decode_image(data), recipe, target_ext, digest)
+        return render(image, recipe, budget=render_budget)
+
+    def write(path, result):
+        _write(path, result, out_dir, ext)
+        done(path)
+        with written:
+            stats.written += 1
+            if report is not None:
+                report(stats)
+
+    def stage(name, work, inbox, outbox, count):
+        stage_stats = stats.stages[name]
+        stage_stats.start = time.perf_counter()
+        if name == "compute" and stack:
+            target = _run_stacked_stage
+            args = (stage_stats, recipe, work, inbox, outbox, stats.failed, done, STACK_SIZE)
+        else:
+            target = _run_stage
+            args = (stage_stats, work, inbox, outbox, stats.failed, done)
+        threads = [threading.Thread(target=target, args=args, daemon=True) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    stages = (("read", stage("read", read, paths_in, decoded, readers), decoded),
+              ("compute", stage("compute", compute, decoded, rendered, workers), rendered),
+              ("write", stage("write", write, rendered, None, writers), None))
+
+    # A stage passes the end marker on once all of its threads have seen it
+    for name, threads, outbox in stages:
+        for thread in threads:
+            thread.join()
+        stats.stages[name].end = time.perf_counter()
+        if outbox is not None:
+            outbox.put(_DONE)
+
+    stats.end = time.perf_counter()
+    cv2.setNumThreads(saved_threads)
+    return stats
@@ -1,5 +1,24 @@
 import cv2
 import numpy as np
+from processing.graph import TaskGraph
+
+def gaussian_kernel_size(value):
+    # Convert value to kernel size (odd number, minimum 3)
+    return max(3, int(value / 2) * 2 + 1)
+
+def median_kernel_size(value):
+    # Convert value to kernel size (odd number, minimum 3)
+    return max(3, int(value / 4) * 2 + 1)
+
+def selective_kernel_size(intensity):
+    # Selective blur intensity (0-100) to an odd kernel size up to 51
+    kernel_size = max(1, (intensity * 51) // 100)
+    if kernel_size % 2 == 0:
+        kernel_size += 1
+    return kernel_size
+
+# Lens blur radius in pixels at depth 1.0 (same reach as a 51px selective kernel)
+LENS_MAX_RADIUS = 25
 
 def gaussian_blur(image, value):
     if value == 0:
@@ -11,8 +30,7 @@ def gaussian_blur(image, value):
     if has_alpha:
         b, g, r, a = cv2.split(image)
         
-        # Convert value to kernel size (odd number, minimum 3)
-        k = max(3, int(value / 2) * 2 + 1)
+        k = gaussian_kernel_size(value)
         sigma = max(0.3 * ((k - 1) * 0.5 - 1) + 0.8, 0.8)
         
         # Apply blur to color only
@@ -23,8 +41,7 @@ def gaussian_blur(image, value):
         # Merge back
         return cv2.merge([b_blur, g_blur, r_blur, a])
     else:
-        # Convert value to kernel size (odd number, minimum 3)
-        k = max(3, int(value / 2) * 2 + 1)
+        k = gaussian_kernel_size(value)
         
         # Apply Gaussian blur
         sigma = max(0.3 * ((k - 1) * 0.5 - 1) + 0.8, 0.8)
@@ -40,8 +57,7 @@ def median_blur(image, value):
     if has_alpha:
         b, g, r, a = cv2.split(image)
         
-        # Convert value to kernel size (odd number, minimum 3)
-        k = max(3, int(value / 4) * 2 + 1)
+        k = median_kernel_size(value)
         
         # Apply blur to color
         b_blur = cv2.medianBlur(b, k)
@@ -51,7 +67,241 @@ def median_blur(image, value):
         # Merge back
         return cv2.merge([b_blur, g_blur, r_blur, a])
     else:
-        # Convert value to kernel size (odd number, minimum 3)
-        k = max(3, int(value / 4) * 2 + 1)
+        k = median_kernel_size(value)
         
         return cv2.medianBlur(image, k)
+
+# Applying selective blur using roi extraction
+def apply_selective_blur(image, masks, executor=None):
+    if not masks:
+        return image.copy()
+    
+    result = image.copy()
+    
+    # Separate masks by blur type 
+    gaussian_masks = []
+    median_masks = []
+    lens_masks = []
+    
+    for mask_data in masks:
+        if mask_data['blur_type'] == 'gaussian':
+            gaussian_masks.append(mask_data)
+        elif mask_data['blur_type'] == 'lens':
+            lens_masks.append(mask_data)
+        else:
+            median_masks.append(mask_data)
+    
+    # All lens areas share one depth map and one pass. A mask cut from a
+    # larger one carries its origin there, which fixes the blur's grid.
+    if lens_masks:
+        origin = lens_masks[0].get('origin', (0, 0))
+        result = lens_blur(result, lens_depth(lens_masks), origin=origin)
+    
+    # Gaussian areas first, then median ones
+    ops = _gaussian_ops(gaussian_masks) + _median_ops(median_masks)
+    pool = executor.pool if executor is not None else None
+    if pool is None or len(ops) < 2:
+        for op in ops:
+            _blend_box(result, *op, executor)
+        return result
+    
+    # Areas that do not overlap an earlier one are independent, so they run
+    # side by side, each on one thread and its own part of result
+    graph = TaskGraph()
+    for i, op in enumerate(ops):
+        deps = [str(j) for j in range(i) if _overlap(ops[j][1], op[1])]
+        graph.add(str(i), lambda *_, op=op: _blend_box(result, *op, None), *deps)
+    graph.run(pool)
+    return result
+
+# Blend blurred ROI back by the feathered mask
+def _blend_roi(roi, blurred_roi, mask_roi):
+    # Apply mask within ROI only. The mask broadcasts over the color
+    # channels and the sum builds in place, two float32 copies of the ROI
+    # at most instead of six
+    mask_normalized = mask_roi.astype(np.float32) / 255.0
+    
+    if len(roi.shape) == 3:  # Color image
+        mask_normalized = mask_normalized[:, :, None]
+    blended = roi * (1 - mask_normalized)
+    blended += blurred_roi * mask_normalized
+    return blended
+
+def _blur_and_blend(roi, mask_roi, blur):
+    return _blend_roi(roi, blur(roi), mask_roi).astype(roi.dtype)
+
+def _blur_roi(roi, mask_roi, blur, halo, executor):
+    # Large ROIs are split into bands and blended in parallel
+    if executor is None:
+        return _blur_and_blend(roi, mask_roi, blur)
+    return executor.map_bands(lambda r, m: _blur_and_blend(r, m, blur), roi, halo, mask_roi)
+
+def _blend_box(result, mask, box, blur, halo, executor):
+    # Blur one mask's box of result and paste it back; reads and writes only the box
+    y1, y2, x1, x2 = box
+    result[y1:y2, x1:x2] = _blur_roi(result[y1:y2, x1:x2], mask[y1:y2, x1:x2], blur, halo, executor)
+
+def _overlap(a, b):
+    return a[0] < b[1] and b[0] < a[1] and a[2] < b[3] and b[2] < a[3]
+
+def _mask_box(mask_data, min_size):
+    # (y1, y2, x1, x2) around the mask, None when empty or too small to blur.
+    # A mask cut from a larger one brings the box of the whole one ('box'),
+    # so the size test and the box edges are those of a full pass, cut to
+    # the part at hand.
+    mask = mask_data['mask']
+    box = mask_data['box'] if 'box' in mask_data else _bounds(mask > 0)
+    if box is None:
+        return None
+    y1, y2, x1, x2 = box
+    if y2 - y1 < min_size or x2 - x1 < min_size:
+        return None
+    h, w = mask.shape[:2]
+    y1, y2, x1, x2 = max(0, y1), min(h, y2), max(0, x1), min(w, x2)
+    if y2 <= y1 or x2 <= x1:
+        return None
+    return y1, y2, x1, x2
+
+# Gaussian blur from masking (to roi area only), as (mask, box, blur, halo) steps
+def _gaussian_ops(masks):
+    ops = []
+    for mask_data in masks:
+        kernel_size = selective_kernel_size(mask_data['intensity'])
+        
+        # Skip empty masks and very small ROIs (no blur effect)
+        box = _mask_box(mask_data, 3)
+        if box is None:
+            continue
+        
+        blur = lambda r, k=kernel_size: cv2.GaussianBlur(r, (k, k), 0)
+        ops.append((mask_data['mask'], box, blur, kernel_size // 2))
+    return ops
+
+# Median blur from masking, grouped by kernel size
+def _median_ops(masks):
+    masks_by_kernel = {}
+    for mask_data in masks:
+        kernel_size = selective_kernel_size(mask_data['intensity'])
+        masks_by_kernel.setdefault(kernel_size, []).append(mask_data)
+    
+    ops = []
+    for kernel_size, mask_list in masks_by_kernel.items():
+        for mask_data in mask_list:
+            # Skip empty masks and ROIs smaller than the kernel
+            box = _mask_box(mask_data, kernel_size)
+            if box is None:
+                continue
+            
+            blur = lambda r, k=kernel_size: cv2.medianBlur(r, k)
+            ops.append((mask_data['mask'], box, blur, kernel_size // 2))
+    return ops
+
+# Depth map (0-1) from lens masks: feathered mask value times intensity
+def lens_depth(masks):
+    depth = None
+    for mask_data in masks:
+        # Scaled in 8 bits, only the final map is converted to float
+        layer = cv2.multiply(mask_data['mask'], 1.0, scale=mask_data['intensity'] / 100)
+        depth = layer if depth is None else cv2.max(depth, layer)
+    return depth.astype(np.float32) * np.float32(1 / 255)
+
+def _level_factor(radius):
+    # Whole-pixel downscale of a blur level, about radius/2 so the blur on
+    # the small copy has a sigma near 1px
+    return max(1, int(radius // 2))
+
+def _blur_level(image, radius):
+    # Gaussian of sigma radius/2, run on a copy downscaled by the level's
+    # factor (a whole number, which the image size is a multiple of), so the
+    # cost does not grow with the radius
+    if radius <= 0:
+        return image
+    factor = _level_factor(radius)
+    if factor == 1:
+        return cv2.GaussianBlur(image, (0, 0), radius / 2.0)
+    h, w = image.shape[:2]
+    small = cv2.resize(image, (w // factor, h // factor), interpolation=cv2.INTER_AREA)
+    small = cv2.GaussianBlur(small, (0, 0), radius / (2.0 * factor))
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+
+def lens_radii(max_radius):
+    # Octave spaced pyramid levels, plus the maximum itself
+    radii = [0, 1]
+    while radii[-1] * 2 < max_radius:
+        radii.append(radii[-1] * 2)
+    if radii[-1] < max_radius:
+        radii.append(max_radius)
+    return radii
+
+def _bounds(selection):
+    # Bounding box of the True pixels, or None
+    rows = np.nonzero(np.any(selection, axis=1))[0]
+    if len(rows) == 0:
+        return None
+    cols = np.nonzero(np.any(selection, axis=0))[0]
+    return rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+def _level_reach(radius):
+    # How far a level pixel reads: the small copy's blur plus one block each
+    # way for the down and up scaling
+    return 3 * radius + 2 * _level_factor(radius)
+
+def _level_in(image, radius, y1, y2, x1, x2, origin=(0, 0)):
+    # Blur level for one window, computed on the window plus its reach. The
+    # downscale blocks sit on a grid fixed in image coordinates (origin is
+    # where this image sits in the full one), and whatever the reach finds
+    # outside image is mirrored in, so every window gets the same pixels as
+    # a full pass as long as image holds the reach around it.
+    h, w = image.shape[:2]
+    oy, ox = origin
+    factor = _level_factor(radius)
+    reach = _level_reach(radius)
+    gy1 = (oy + y1 - reach) // factor * factor - oy
+    gx1 = (ox + x1 - reach) // factor * factor - ox
+    gy2 = -(-(oy + y2 + reach) // factor) * factor - oy
+    gx2 = -(-(ox + x2 + reach) // factor) * factor - ox
+    region = image[max(0, gy1):min(h, gy2), max(0, gx1):min(w, gx2)]
+    region = cv2.copyMakeBorder(region, max(0, -gy1), max(0, gy2 - h), max(0, -gx1),
+                                max(0, gx2 - w), cv2.BORDER_REFLECT_101)
+    return _blur_level(region, radius)[y1 - gy1:y2 - gy1, x1 - gx1:x2 - gx1]
+
+def lens_halo(max_radius=LENS_MAX_RADIUS):
+    # Context a region of a lens blur needs to come out as in a full pass
+    return _level_reach(max_radius)
+
+# Variable radius blur: each pixel's radius is depth * max_radius. The
+# image is blurred at a few octave radii and every pixel interpolates
+# between the two levels around its own radius, so the cost depends on the
+# number of levels rather than on the radius.
+def lens_blur(image, depth, max_radius=LENS_MAX_RADIUS, origin=(0, 0)):
+    if depth is None or not np.any(depth > 0):
+        return image.copy()
+    
+    # Each level is blurred once over the whole depth area
+    radius = depth * np.float32(max_radius)
+    area = _bounds(radius > 0)
+    ay, ax = area[0], area[2]
+    levels = {}
+    
+    result = image.copy()
+    radii = lens_radii(max_radius)
+    for low, high in zip(radii, radii[1:]):
+        # Only the window of pixels whose radius falls between these levels
+        selection = cv2.inRange(radius, float(np.nextafter(np.float32(low), np.float32(high))), high)
+        box = _bounds(selection)
+        if box is None:
+            continue
+        y1, y2, x1, x2 = box
+        
+        pair = []
+        for r in (low, high):
+            if r not in levels:
+                levels[r] = _level_in(image, r, *area, origin)
+            pair.append(levels[r][y1 - ay:y2 - ay, x1 - ax:x2 - ax])
+        levels.pop(low)
+        
+        weight = np.clip((radius[y1:y2, x1:x2] - low) * np.float32(1.0 / (high - low)), 0, 1)
+        blended = cv2.blendLinear(pair[0], pair[1], 1 - weight, weight)
+        cv2.copyTo(blended, selection[y1:y2, x1:x2], result[y1:y2, x1:x2])
+    
+    return result
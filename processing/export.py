@@ -0,0 +1,80 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from processing.pipeline import render
+from processing.segmentation import PRESETS, resize_image
+from utils.image_io import decode_image, encode_image
+from utils.result_cache import is_png
+
+def cascade_plan(shape, names=None):
+    # Order to make the presets in, largest first, each paired with the
+    # preset it is resized from (None for the full image): the smallest one
+    # already made that is at least as big both ways. Smaller sources mean
+    # less to read for INTER_AREA, and the chain follows the sizes down.
+    names = list(names or PRESETS)
+    order = sorted(names, key=lambda n: PRESETS[n][0] * PRESETS[n][1], reverse=True)
+    height, width = shape[:2]
+    plan = []
+    for i, name in enumerate(order):
+        tw, th = PRESETS[name]
+        source = None
+        area = width * height
+        for done in order[:i]:
+            w, h = PRESETS[done]
+            if w >= tw and h >= th and w * h < area:
+                source, area = done, w * h
+        plan.append((name, source))
+    return plan
+
+def export_path(out_dir, stem, name, image, ext=".jpg"):
+    # Transparent results are always written as png
+    if image.shape[-1:] == (4,):
+        ext = ".png"
+    return os.path.join(out_dir, f"{stem}_{name}{ext}")
+
+def _save(path, image):
+    data = encode_image(image, os.path.splitext(path)[1])
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+def export_presets(image, out_dir, stem, ext=".jpg", names=None, workers=None):
+    # One rendered image to every preset. Encoding (the slow part) starts on
+    # the pool as soon as each size exists, while the next size is resized.
+    # Returns {preset: path}.
+    os.makedirs(out_dir, exist_ok=True)
+    plan = cascade_plan(image.shape, names)
+    sized = {}
+    with ThreadPoolExecutor(workers or os.cpu_count() or 1) as pool:
+        futures = {}
+        for name, source in plan:
+            width, height = PRESETS[name]
+            sized[name] = resize_image(image if source is None else sized[source], width, height)
+            path = export_path(out_dir, stem, name, sized[name], ext)
+            futures[name] = pool.submit(_save, path, sized[name])
+        return {name: future.result() for name, future in futures.items()}
+
+def export_cached(cache, data, out_dir, stem, recipe, ext=".jpg", names=None, workers=None,
+                  budget=None):
+    # export_presets() of the render of encoded image data, each preset file
+    # looked up in the ResultCache first; only a miss decodes and renders.
+    # Returns {preset: path}.
+    os.makedirs(out_dir, exist_ok=True)
+    names = list(names or PRESETS)
+    digest = hashlib.sha256(data).hexdigest()
+    keys = {name: cache.key(digest, recipe, "preset", extra=name + ext) for name in names}
+    cached = {name: cache.get(key) for name, key in keys.items()}
+    if all(encoded is not None for encoded in cached.values()):
+        paths = {}
+        for name, encoded in cached.items():
+            paths[name] = os.path.join(out_dir, f"{stem}_{name}{'.png' if is_png(encoded) else ext}")
+            with open(paths[name], "wb") as f:
+                f.write(encoded)
+        return paths
+
+    result = render(decode_image(data), recipe, budget=budget)
+    paths = export_presets(result, out_dir, stem, ext, names, workers)
+    for name, path in paths.items():
+        with open(path, "rb") as f:
+            cache.put(keys[name], f.read())
+    return paths
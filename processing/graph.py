@@ -0,0 +1,93 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+class GraphStats:
+    # Start and end of every task of one run. The critical path is the chain
+    # of dependent tasks with the most time in it: no pool can make the run
+    # shorter than that.
+    def __init__(self):
+        self.times = {}
+        self.deps = {}
+        self.start = None
+        self.end = None
+
+    @property
+    def wall(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def duration(self, name):
+        start, end = self.times[name]
+        return end - start
+
+    @property
+    def busy(self):
+        return sum(self.duration(name) for name in self.times)
+
+    def critical_path(self):
+        # Tasks are recorded as they finish, which is a dependency order
+        best = {}
+        for name in self.times:
+            prev = max(self.deps[name], key=lambda d: best[d][0], default=None)
+            best[name] = (self.duration(name) + (best[prev][0] if prev else 0.0), prev)
+        if not best:
+            return [], 0.0
+        name = max(best, key=lambda n: best[n][0])
+        total = best[name][0]
+        path = []
+        while name is not None:
+            path.append(name)
+            name = best[name][1]
+        return path[::-1], total
+
+    def summary(self):
+        path, seconds = self.critical_path()
+        chain = " > ".join(f"{name} {self.duration(name) * 1e3:.0f}" for name in path)
+        return (f"{self.wall * 1e3:.0f} ms wall, {self.busy * 1e3:.0f} ms of work, "
+                f"critical path {seconds * 1e3:.0f} ms ({chain})")
+
+class TaskGraph:
+    # Named tasks and the tasks whose results they take as arguments. run()
+    # starts each task once its inputs are done, so independent branches
+    # overlap on the pool. Tasks must not wait on the pool they run on.
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, name, func, *deps):
+        missing = [d for d in deps if d not in self.tasks]
+        if missing:
+            raise ValueError(f"Unknown inputs of {name}: {', '.join(missing)}")
+        self.tasks[name] = (func, deps)
+        return name
+
+    def run(self, pool=None, stats=None):
+        # Results of all tasks by name. Without a pool the tasks run in the
+        # order they were added.
+        stats = stats if stats is not None else GraphStats()
+        stats.deps.update({name: deps for name, (_, deps) in self.tasks.items()})
+        stats.start = time.perf_counter()
+        results = {}
+
+        def call(name):
+            func, deps = self.tasks[name]
+            began = time.perf_counter()
+            value = func(*(results[d] for d in deps))
+            stats.times[name] = (began, time.perf_counter())
+            return value
+
+        if pool is None:
+            for name in self.tasks:
+                results[name] = call(name)
+        else:
+            waiting = list(self.tasks)
+            running = {}
+            while waiting or running:
+                ready = [n for n in waiting if all(d in results for d in self.tasks[n][1])]
+                for name in ready:
+                    waiting.remove(name)
+                    running[pool.submit(call, name)] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+
+        stats.end = time.perf_counter()
+        return results
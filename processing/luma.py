@@ -0,0 +1,75 @@
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+def to_gray(image):
+    # Grayscale plane of a BGR, BGRA or single channel image
+    if len(image.shape) == 3:
+        if image.shape[2] == 4:
+            return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+def otsu_threshold(hist):
+    # Same threshold cv2.THRESH_OTSU picks, from a 256-bin histogram
+    hist = hist.astype(np.float64)
+    levels = np.arange(256, dtype=np.float64)
+    w0 = np.cumsum(hist)
+    w1 = w0[-1] - w0
+    sum0 = np.cumsum(hist * levels)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mu0 = sum0 / w0
+        mu1 = (sum0[-1] - sum0) / w1
+        between = w0 * w1 * (mu0 - mu1) ** 2
+    between[(w0 == 0) | (w1 == 0)] = 0
+    return int(np.argmax(between))
+
+class LumaPlane:
+    # Gray plane and histogram of one image, computed once. Two threads may
+    # both fill _hist/_otsu; they compute the same value, so either one wins.
+    __slots__ = ("gray", "_hist", "_otsu")
+
+    def __init__(self, image):
+        self.gray = to_gray(image)
+        self._hist = None
+        self._otsu = None
+
+    @property
+    def hist(self):
+        if self._hist is None:
+            self._hist = cv2.calcHist([self.gray], [0], None, [256], [0, 256]).ravel()
+        return self._hist
+
+    @property
+    def otsu(self):
+        if self._otsu is None:
+            self._otsu = otsu_threshold(self.hist)
+        return self._otsu
+
+    def threshold(self, value, inverse=False):
+        # One compare pass over the cached plane
+        mode = cv2.THRESH_BINARY_INV if inverse else cv2.THRESH_BINARY
+        _, binary = cv2.threshold(self.gray, value, 255, mode)
+        return binary
+
+class LumaCache:
+    # Luma planes keyed by the identity of the image they came from.
+    # Not locked: each thread (UI, stream worker) keeps its own.
+    def __init__(self, capacity=4):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+    def get(self, image):
+        hit = self.entries.get(id(image))
+        if hit is not None and hit[0] is image:
+            self.entries.move_to_end(id(image))
+            return hit[1]
+
+        plane = LumaPlane(image)
+        self.entries[id(image)] = (image, plane)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return plane
+
+    def clear(self):
+        self.entries.clear()
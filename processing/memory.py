@@ -0,0 +1,106 @@
+import os
+import threading
+import tracemalloc
+import numpy as np
+
+def physical_memory():
+    # Bytes of RAM, or None when it cannot be read
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def default_render_budget():
+    # A quarter of the physical memory for one render, or 2 GB
+    total = physical_memory()
+    return total // 4 if total else 2 * 2**30
+
+def array_bytes(*values):
+    # Bytes of the numpy buffers among values (lists and tuples are searched)
+    total = 0
+    for value in values:
+        if isinstance(value, np.ndarray):
+            total += value.nbytes
+        elif isinstance(value, (list, tuple)):
+            total += array_bytes(*value)
+    return total
+
+# tracemalloc is process wide; renders that want it share one session and
+# leave it running if somebody else started it
+_trace_lock = threading.Lock()
+_trace_users = 0
+_trace_owned = False
+
+def _start_trace():
+    global _trace_users, _trace_owned
+    with _trace_lock:
+        if _trace_users == 0:
+            _trace_owned = not tracemalloc.is_tracing()
+            if _trace_owned:
+                tracemalloc.start()
+        _trace_users += 1
+
+def _stop_trace():
+    global _trace_users
+    with _trace_lock:
+        _trace_users -= 1
+        if _trace_users == 0 and _trace_owned:
+            tracemalloc.stop()
+
+class MemoryStats:
+    # Peak memory of every stage of one render, two ways:
+    #   arrays  bytes of the numpy buffers going in and coming out
+    #   traced  tracemalloc peak above the level at the start of the stage.
+    #           numpy reports its buffers to tracemalloc, so this includes
+    #           the float32 temporaries of a blend that are gone again.
+    # OpenCV's scratch memory shows in neither; the larger of the two is the
+    # stage's peak. Stages running at once (a task graph) see each other's
+    # allocations in traced.
+    def __init__(self, trace=True):
+        self.trace = trace
+        self.stages = {}
+        self.mode = "full"
+        self.estimate = None
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        if self.trace:
+            _start_trace()
+        return self
+
+    def __exit__(self, *exc):
+        if self.trace:
+            _stop_trace()
+
+    def run(self, name, func, *args):
+        # func(*args), recording its peak under name
+        tracing = self.trace and tracemalloc.is_tracing()
+        if tracing:
+            start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        value = func(*args)
+        traced = tracemalloc.get_traced_memory()[1] - start if tracing else 0
+        self.record(name, array_bytes(*args, value), traced)
+        return value
+
+    def record(self, name, arrays, traced=0):
+        # A stage that runs more than once (tiles) keeps its largest peak
+        with self.lock:
+            old = self.stages.get(name, (0, 0))
+            self.stages[name] = (max(old[0], arrays), max(old[1], traced))
+
+    def peak(self, name):
+        return max(self.stages[name])
+
+    @property
+    def peak_bytes(self):
+        return max((self.peak(name) for name in self.stages), default=0)
+
+    @property
+    def heaviest(self):
+        return max(self.stages, key=self.peak, default=None)
+
+    def summary(self):
+        stages = ", ".join(f"{name} {self.peak(name) / 2**20:.0f}" for name in self.stages)
+        mode = f" ({self.mode})" if self.mode != "full" else ""
+        return f"peak {self.peak_bytes / 2**20:.0f} MB{mode}: {stages}"
@@ -0,0 +1,97 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+def split_bands(height, count, halo=0, min_rows=64):
+    # Row bands as (y1, y2, top, bottom): output rows y1:y2, input rows top:bottom
+    count = max(1, min(count, height // max(min_rows, 1)))
+    edges = np.linspace(0, height, count + 1).astype(int)
+    bands = []
+    for y1, y2 in zip(edges[:-1], edges[1:]):
+        bands.append((y1, y2, max(0, y1 - halo), min(height, y2 + halo)))
+    return bands
+
+def gil_enabled():
+    # False on a free-threaded build (3.13t and later) running without the GIL
+    check = getattr(sys, "_is_gil_enabled", None)
+    return True if check is None else check()
+
+def image_workers(cores=None):
+    # Images to render at once. Without the GIL every core takes an image.
+    # With it the Python glue between cv2 calls runs one thread at a time,
+    # so half the cores are left to OpenCV's own threads.
+    cores = cores or os.cpu_count() or 1
+    return cores if not gil_enabled() else max(1, cores // 2)
+
+def share_cores(workers):
+    # Split the cores with OpenCV's own threading instead of oversubscribing.
+    # The setting is process wide; returns the old one to restore.
+    saved = cv2.getNumThreads()
+    if workers > 1:
+        cv2.setNumThreads(max(1, (os.cpu_count() or 1) // workers))
+    return saved
+
+class BandExecutor:
+    # Runs filters on halo-padded row bands in a thread pool.
+    # OpenCV and numpy release the GIL, so bands really run in parallel.
+    def __init__(self, workers=None, min_rows=64):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_rows = min_rows
+        self.pool = ThreadPoolExecutor(self.workers) if self.workers > 1 else None
+
+        self.saved_threads = share_cores(self.workers)
+
+    def map_bands(self, func, image, halo=0, *extras):
+        # Extra arrays with the same height (masks) are banded alongside the image
+        bands = split_bands(image.shape[0], self.workers, halo, self.min_rows)
+        if self.pool is None or len(bands) == 1:
+            return func(image, *extras)
+
+        def run(band):
+            y1, y2, top, bottom = band
+            out = func(*[a[top:bottom] for a in (image,) + extras])
+            return out[y1 - top:y2 - top]
+
+        return np.concatenate(list(self.pool.map(run, bands)), axis=0)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+            cv2.setNumThreads(self.saved_threads)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ImagePool:
+    # Whole images on a thread pool, one image per task. The processing
+    # functions keep no shared mutable state, so the threads read the same
+    # arrays and nothing is pickled; on a free-threaded build the Python
+    # parts run in parallel too.
+    def __init__(self, workers=None):
+        self.workers = workers or image_workers()
+        self.pool = ThreadPoolExecutor(self.workers) if self.workers > 1 else None
+        self.saved_threads = share_cores(self.workers)
+
+    def map(self, func, images, *args):
+        # Results in input order
+        if self.pool is None:
+            return [func(image, *args) for image in images]
+        return list(self.pool.map(lambda image: func(image, *args), images))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+            cv2.setNumThreads(self.saved_threads)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
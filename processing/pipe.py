@@ -0,0 +1,42 @@
+import sys
+from processing.pipeline import render
+from processing.stream import threaded, StreamStats
+from utils.pipe_io import read_pipe, PipeWriter
+
+def render_pipe(images, recipe, budget=None):
+    # render() of every decoded image; None (and any image that fails to
+    # render, reported on stderr) passes through as None so the output
+    # keeps its place
+    for index, image in enumerate(images):
+        if image is None:
+            print(f"Image {index}: could not decode", file=sys.stderr)
+            yield None
+            continue
+        try:
+            yield render(image, recipe, budget=budget)
+        except Exception as e:
+            print(f"Image {index}: render failed: {e!r}", file=sys.stderr)
+            yield None
+
+def run_pipe(source, sink, recipe, ext=".png", framed=False, queue_size=4, report=None,
+             budget=None):
+    # Read + decode and render run in their own threads, the caller encodes
+    # and writes. At most queue_size images wait between stages.
+    stats = StreamStats()
+    writer = PipeWriter(sink, ext, framed)
+
+    images = threaded(read_pipe(source, framed), queue_size)
+    results = threaded(render_pipe(images, recipe, budget), queue_size)
+    for result in results:
+        if result is None:
+            if not framed:
+                raise ValueError("Could not decode or render the input image")
+            writer.skip()
+            stats.failed += 1
+        else:
+            writer.write(result)
+        stats.tick()
+        if report is not None and stats.frames % 100 == 0:
+            report(stats)
+
+    return stats
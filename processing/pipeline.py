@@ -0,0 +1,614 @@
+import json
+from collections import OrderedDict
+import cv2
+import numpy as np
+from processing.tone import black_white
+from processing.registry import plan_recipe, plan_halo, has_global, estimate_stage_bytes
+from processing.segmentation import (
+    grabcut_mask, simple_mask, edge_mask, edge_mask_multiscale, apply_alpha_mask, show_binary_mask,
+    resize_image
+)
+from processing.luma import LumaCache, LumaPlane
+from processing.graph import TaskGraph
+
+# Edit recipe with the same defaults as a freshly loaded image in the app
+DEFAULT_RECIPE = {
+    "gaussian": 0,
+    "median": 0,
+    "masks": [],
+    "darken": 0,
+    "brighten": 0,
+    "grayscale": False,
+    "blackwhite": False,
+    "bw_threshold": 127,
+    "background": None,
+    "bg_threshold": 240,
+    "binary": False,
+}
+
+# "edge_fast" finds the contour on a pyramid level; a different (coarser)
+# mask than "edge", so it is only used when asked for
+BACKGROUND_METHODS = ("grabcut", "simple", "edge", "edge_fast")
+
+def make_recipe(**changes):
+    # Reject unknown keys early so typos in recipe files do not pass silently
+    unknown = set(changes) - set(DEFAULT_RECIPE)
+    if unknown:
+        raise ValueError(f"Unknown recipe keys: {', '.join(sorted(unknown))}")
+
+    if changes.get("background") not in (None,) + BACKGROUND_METHODS:
+        raise ValueError(f"Unknown background method: {changes['background']}")
+
+    recipe = dict(DEFAULT_RECIPE)
+    recipe["masks"] = []
+    recipe.update(changes)
+    return recipe
+
+def load_recipe(path):
+    # Recipe file is a JSON object with any subset of DEFAULT_RECIPE keys
+    with open(path, "r") as f:
+        return make_recipe(**json.load(f))
+
+def parse_recipe_values(values):
+    # String values (query strings, command line) to typed recipe values
+    typed = {}
+    for key, value in values.items():
+        if key not in DEFAULT_RECIPE or key == "masks":
+            raise ValueError(f"Unknown recipe key: {key}")
+        default = DEFAULT_RECIPE[key]
+        if isinstance(default, bool):
+            typed[key] = value.lower() in ("1", "true", "yes", "on")
+        elif isinstance(default, int):
+            typed[key] = int(value)
+        else:
+            typed[key] = value or None
+    return make_recipe(**typed)
+
+def background_mask(image, method, threshold=240, luma=None):
+    if method == "grabcut":
+        return grabcut_mask(image)
+    elif method == "simple":
+        return simple_mask(image, threshold, luma)
+    elif method == "edge":
+        return edge_mask(image)
+    elif method == "edge_fast":
+        return edge_mask_multiscale(image)
+    return None
+
+def roi_halo(recipe):
+    # Pixels of context around a region of interest that the filters can reach
+    return plan_halo(plan_recipe(recipe))
+
+def _measured(memory, name, func, *args):
+    # func(*args), with its peak recorded in memory (a MemoryStats) if given
+    if memory is None:
+        return func(*args)
+    return memory.run(name, func, *args)
+
+def _run_step(step, image, executor):
+    if executor is None or not step.banded:
+        return step.run(image)
+    return executor.map_bands(step.run, image, step.halo)
+
+class RenderCache:
+    # Stage outputs of recent renders plus their luma planes. Entries are
+    # keyed by the source image identity and the recipe values the stage
+    # depends on, so a threshold drag only reruns the threshold itself.
+    # Not locked: one per thread, renders without a cache share nothing.
+    def __init__(self, capacity=6):
+        self.capacity = capacity
+        self.stages = OrderedDict()
+        self.luma = LumaCache()
+        self.windows = OrderedDict()
+
+    def lookup(self, source, key):
+        hit = self.stages.get(key)
+        if hit is not None and hit[0] is source:
+            self.stages.move_to_end(key)
+            return hit[1]
+        return None
+
+    def store(self, source, key, value):
+        self.stages[key] = (source, value)
+        self.stages.move_to_end(key)
+        while len(self.stages) > self.capacity:
+            self.stages.popitem(last=False)
+        return value
+
+    def window(self, source, rect):
+        # Same view object for the same region, so identity keys keep hitting
+        key = (id(source), rect)
+        hit = self.windows.get(key)
+        if hit is not None and hit[0] is source:
+            self.windows.move_to_end(key)
+            return hit[1]
+        view = _slice(source, rect)
+        self.windows[key] = (source, view)
+        while len(self.windows) > 4 * self.capacity:
+            self.windows.popitem(last=False)
+        return view
+
+    def clear(self):
+        self.stages.clear()
+        self.luma.clear()
+        self.windows.clear()
+
+def _slice(image, rect):
+    x1, y1, x2, y2 = rect
+    return image[y1:y2, x1:x2]
+
+def _window(cache, image, rect):
+    return cache.window(image, rect) if cache is not None else _slice(image, rect)
+
+def _cut_mask(cache, mask_data, window):
+    # The part of a mask inside window. It remembers where the window sits
+    # (origin, y x) and the box of the whole mask in window coordinates, so
+    # the blurs size and line up as in a full pass.
+    x1, y1 = window[:2]
+    if 'box' in mask_data:
+        box = mask_data['box']
+    else:
+        rect = mask_footprint(mask_data['mask'])
+        box = (rect[1], rect[3], rect[0], rect[2]) if rect is not None else None
+    if box is not None:
+        box = (box[0] - y1, box[1] - y1, box[2] - x1, box[3] - x1)
+    oy, ox = mask_data.get('origin', (0, 0))
+    return dict(mask_data, mask=_window(cache, mask_data['mask'], window),
+                origin=(oy + y1, ox + x1), box=box)
+
+def _roi_window(image, recipe, roi, cache):
+    # Crop to the region plus halo, masks along with it. Returns the window,
+    # its recipe and where the region sits inside the window.
+    h, w = image.shape[:2]
+    x1, y1, x2, y2 = roi
+    halo = roi_halo(recipe)
+    window = (max(0, x1 - halo), max(0, y1 - halo), min(w, x2 + halo), min(h, y2 + halo))
+    masks = [_cut_mask(cache, m, window) for m in recipe["masks"]]
+    trim = (x1 - window[0], y1 - window[1], x2 - window[0], y2 - window[1])
+    return _window(cache, image, window), dict(recipe, masks=masks), trim
+
+class _Same:
+    # Key part standing for one object: equal only to a key of that same
+    # object. It holds a reference, so while a cache entry lives its id can
+    # not be handed to a new array.
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __hash__(self):
+        return id(self.obj)
+
+    def __eq__(self, other):
+        return isinstance(other, _Same) and other.obj is self.obj
+
+def masks_key(masks):
+    # Mask arrays are never changed in place, so the same array means the
+    # same mask; the key keeps the arrays alive for as long as it is used
+    return tuple((_Same(m['mask']), m['blur_type'], m['intensity']) for m in masks)
+
+def upstream_key(recipe):
+    # Recipe values that decide the image before the B&W threshold
+    return (recipe["gaussian"], recipe["median"], masks_key(recipe["masks"]),
+            recipe["darken"], recipe["brighten"], recipe["grayscale"])
+
+def _render_base(image, recipe, executor=None, trim=None, memory=None):
+    # Runs the planned steps. With trim (x1, y1, x2, y2) the image is a window
+    # with halo; the halo is cut off before the pointwise tail so that only
+    # touches the region itself.
+    channels = image.shape[2] if len(image.shape) == 3 else 1
+    steps = plan_recipe(recipe, channels, executor)
+    tail = len(steps)
+    while tail > 0 and steps[tail - 1].halo == 0:
+        tail -= 1
+
+    temp = image
+    for i, step in enumerate(steps):
+        if i == tail and trim is not None:
+            temp = _slice(temp, trim)
+        temp = _measured(memory, step.name, _run_step, step, temp, executor)
+    if tail == len(steps) and trim is not None:
+        temp = _slice(temp, trim)
+
+    # Never hand the caller's buffer back
+    if np.may_share_memory(temp, image):
+        temp = temp.copy()
+
+    return temp
+
+def _base_keys(image, recipe, trim):
+    # Cache keys of the filter chain's output and of the B&W threshold on it
+    # (None when the recipe has none)
+    key = ("pre", id(image), trim) + upstream_key(recipe)
+    if not (recipe["grayscale"] and recipe["blackwhite"]):
+        return key, None
+    return key, key + ("bw", recipe["bw_threshold"])
+
+def render_base(image, recipe, executor=None, cache=None, trim=None, memory=None):
+    # Everything before background removal (the segmentation input)
+    if cache is None:
+        return _render_base(image, recipe, executor, trim, memory)
+
+    key, bw_key = _base_keys(image, recipe, trim)
+    pre = cache.lookup(image, key)
+    if pre is None:
+        pre = cache.store(image, key, _render_base(image, dict(recipe, blackwhite=False),
+                                                   executor, trim, memory))
+
+    if bw_key is None:
+        return pre
+
+    # Threshold changes only redo the compare on the cached gray plane
+    key = bw_key
+    base = cache.lookup(image, key)
+    if base is None:
+        base = cache.store(image, key, _measured(memory, "blackwhite", black_white, pre,
+                                                 recipe["bw_threshold"], cache.luma.get(pre)))
+    return base
+
+def mask_key(base, method, threshold):
+    # Cache key of the background mask render_tail computes for base
+    return ("mask", id(base), method, threshold if method == "simple" else None)
+
+def segmentation_input(image, recipe, executor=None, cache=None, roi=None, memory=None):
+    # The image render() hands to background removal, for computing the mask
+    # elsewhere (e.g. in steps) and storing it under mask_key()
+    if roi is None:
+        return render_base(image, recipe, executor, cache, memory=memory)
+    window, recipe, trim = _roi_window(image, recipe, roi, cache)
+    return render_base(window, recipe, executor, cache, trim, memory)
+
+def cached_input(image, recipe, cache, roi=None):
+    # segmentation_input() if the cache already holds it, else None
+    trim = None
+    if roi is not None:
+        image, recipe, trim = _roi_window(image, recipe, roi, cache)
+    key, bw_key = _base_keys(image, recipe, trim)
+    base = cache.lookup(image, key)
+    if base is None or bw_key is None:
+        return base
+    return cache.lookup(image, bw_key)
+
+def _luma(image, cache):
+    return cache.luma.get(image) if cache is not None else LumaPlane(image)
+
+def _tail_mask(base, recipe, cache, luma=None, memory=None):
+    # Background mask of base, from the cache when it has one
+    method = recipe["background"]
+    threshold = recipe["bg_threshold"]
+    key = mask_key(base, method, threshold)
+    bg_mask = cache.lookup(base, key) if cache is not None else None
+    if bg_mask is None:
+        if luma is None and method == "simple" and cache is not None:
+            luma = cache.luma.get(base)
+        bg_mask = _measured(memory, "background", background_mask, base, method, threshold, luma)
+        if cache is not None:
+            cache.store(base, key, bg_mask)
+    return bg_mask
+
+def render_tail(base, recipe, bg_mask=None, cache=None, memory=None):
+    # Background removal, reusing a precomputed mask when one is given
+    temp = base
+    method = recipe["background"]
+    if method is not None:
+        if bg_mask is None:
+            bg_mask = _tail_mask(base, recipe, cache, memory=memory)
+        temp = _measured(memory, "alpha", apply_alpha_mask, temp, bg_mask, method == "grabcut")
+
+    if recipe["binary"]:
+        # Alpha does not change the luma, grabcut's cleared pixels do
+        luma = None
+        if cache is not None:
+            luma = cache.luma.get(base if method != "grabcut" else temp)
+        temp = _measured(memory, "binary", show_binary_mask, temp, "otsu", luma)
+
+    return temp
+
+def render_graph(image, recipe, bg_mask=None, executor=None, cache=None, roi=None, memory=None):
+    # render() as a task graph: base (the filter chain), then background mask,
+    # alpha and binary view. The mask and the gray plane the binary view
+    # reads both depend only on base, so they run side by side. The two only
+    # touch different parts of the cache (stage entries and luma planes).
+    method = recipe["background"]
+    tail = dict(recipe, masks=[]) if roi is not None else recipe
+    graph = TaskGraph()
+    last = graph.add("base", lambda: segmentation_input(image, recipe, executor, cache, roi, memory))
+
+    if recipe["binary"] and method != "grabcut" or method == "simple" and bg_mask is None:
+        graph.add("luma", lambda base: _luma(base, cache), "base")
+    if method is not None:
+        if bg_mask is not None:
+            graph.add("mask", lambda base: bg_mask, "base")
+        elif method == "simple":
+            graph.add("mask", lambda base, luma: _tail_mask(base, tail, cache, luma, memory),
+                      "base", "luma")
+        else:
+            graph.add("mask", lambda base: _tail_mask(base, tail, cache, memory=memory), "base")
+        last = graph.add("alpha", lambda base, mask: _measured(
+            memory, "alpha", apply_alpha_mask, base, mask, method == "grabcut"), "base", "mask")
+    if recipe["binary"]:
+        if method != "grabcut":
+            graph.add("binary", lambda temp, luma: _measured(
+                memory, "binary", show_binary_mask, temp, "otsu", luma), last, "luma")
+        else:
+            # Cleared pixels change the gray plane, so it comes from the result
+            graph.add("binary", lambda temp: _measured(
+                memory, "binary", show_binary_mask, temp, "otsu", _luma(temp, cache)), last)
+        last = "binary"
+    return graph, last
+
+# Smallest band of rows a tiled render runs, and smallest proxy scale of a
+# background mask
+MIN_TILE_ROWS = 64
+MIN_PROXY_SCALE = 0.125
+
+class MemoryPlan:
+    # How render() keeps one recipe under a byte budget:
+    #   rows      filter chain in bands of this many rows, None for a plain render
+    #   scale     background mask computed on base scaled by this
+    #   estimate  predicted peak bytes of a plain render
+    #   planned   predicted peak bytes with the bands and the proxy
+    #   budget    what it was planned for
+    def __init__(self, rows=None, scale=1.0, estimate=0, height=0, planned=None, budget=None):
+        self.rows = rows
+        self.scale = scale
+        self.estimate = estimate
+        self.height = height
+        self.planned = estimate if planned is None else planned
+        self.budget = budget
+
+    @property
+    def mode(self):
+        if self.rows is None:
+            return "full"
+        parts = []
+        if self.rows < self.height:
+            parts.append(f"tiled in {-(-self.height // self.rows)} bands")
+        if self.scale < 1.0:
+            parts.append(f"mask at {self.scale:.0%}")
+        if self.budget is not None and self.planned > self.budget:
+            parts.append(f"over budget, about {self.planned / 2**20:.0f} MB")
+        return ", ".join(parts) or "full"
+
+def plan_memory(recipe, shape, budget):
+    # Peak bytes of render() come from the source, base (the filter chain's
+    # output) and the heaviest stage's working buffers. Over budget, the
+    # filters run in bands of rows, so their buffers shrink with the band
+    # while base is filled in place. If background removal still does not
+    # fit, its mask is computed on a smaller proxy of base and scaled back
+    # up. The rest of the tail (alpha, the binary view) works on the whole
+    # result and cannot shrink, so the budget is best effort: a render that
+    # cannot fit runs anyway, in the smallest bands and proxy, and its plan
+    # says how far over it is expected to go.
+    stages = estimate_stage_bytes(recipe, shape)
+    estimate = max((peak for _, peak, _ in stages), default=0)
+    if budget is None or estimate <= budget:
+        return MemoryPlan(estimate=estimate, budget=budget)
+
+    h, w = shape[:2]
+    source = int(np.prod(shape))
+    filters = [(peak, out) for name, peak, out in stages if name not in ("background", "binary")]
+    base = filters[-1][1] if filters else source
+    row_cost = max((peak - source for peak, _ in filters), default=0) / h
+    rows = int((budget - source - base) / row_cost) if row_cost else h
+    rows = min(h, max(MIN_TILE_ROWS, rows))
+    planned = [source + base + row_cost * rows] if filters else []
+
+    scale = 1.0
+    for name, peak, _ in stages:
+        if name == "background" and peak > budget:
+            # The BGRA result and the full size mask stay, the rest of the
+            # mask's working memory shrinks with the proxy's area
+            alpha = 5 * h * w
+            work = peak - source - base - alpha
+            room = budget - source - base - alpha
+            if work > alpha:
+                # Not worth it for masks that cost less than the result itself
+                scale = np.sqrt(max(room, 0) / work)
+                scale = float(min(1.0, max(MIN_PROXY_SCALE, scale)))
+                peak = source + base + alpha + work * scale ** 2
+        if name in ("background", "binary"):
+            planned.append(peak)
+    return MemoryPlan(rows, scale, estimate, h, int(max(planned, default=0)), budget)
+
+def proxy_mask(base, method, threshold, scale):
+    # Background mask of base computed on a copy scaled by scale
+    h, w = base.shape[:2]
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    small = cv2.resize(base, size, interpolation=cv2.INTER_AREA)
+    mask = background_mask(small, method, threshold)
+    return cv2.resize(mask, (w, h), interpolation=cv2.INTER_LINEAR)
+
+def render_tiled(image, recipe, plan, bg_mask=None, executor=None, cache=None, roi=None,
+                 memory=None):
+    # render() within a MemoryPlan. A segmentation input the cache already
+    # holds is used as it is. Otherwise the filter chain runs as usual when
+    # it fits, or band by band into one base, each band reading its halo, so
+    # the pixels match a whole-image pass as in any region render; tiled
+    # stages are not cached, caching is what a tight budget cannot afford.
+    # The background mask comes from bg_mask or the cache (a finished GrabCut
+    # job) before a proxy is computed.
+    h, w = image.shape[:2]
+    x1, y1, x2, y2 = roi if roi is not None else (0, 0, w, h)
+    base = cached_input(image, recipe, cache, roi) if cache is not None else None
+    rows = plan.height
+    if base is None and plan.rows >= y2 - y1:
+        base = segmentation_input(image, recipe, executor, cache, roi, memory)
+    elif base is None:
+        cache = None
+        rows = plan.rows
+        for y in range(y1, y2, plan.rows):
+            band = segmentation_input(image, recipe, executor, None,
+                                      (x1, y, x2, min(y2, y + plan.rows)), memory)
+            if base is None:
+                base = np.empty((y2 - y1,) + band.shape[1:], band.dtype)
+            base[y - y1:y - y1 + band.shape[0]] = band
+
+    method = recipe["background"]
+    threshold = recipe["bg_threshold"]
+    if method is not None and bg_mask is None and cache is not None:
+        bg_mask = cache.lookup(base, mask_key(base, method, threshold))
+    scale = 1.0
+    if method is not None and bg_mask is None and plan.scale < 1.0:
+        # Not stored: the cache would hand it out as the full size mask
+        scale = plan.scale
+        bg_mask = _measured(memory, "background", proxy_mask, base, method, threshold, scale)
+    if memory is not None:
+        # What actually ran, a cached base or mask makes bands or a proxy moot
+        memory.mode = MemoryPlan(rows, scale, plan.estimate, plan.height, plan.planned,
+                                 plan.budget).mode
+    return render_tail(base, dict(recipe, masks=[]), bg_mask, cache, memory)
+
+def render(image, recipe, bg_mask=None, executor=None, cache=None, roi=None,
+           pool=None, stats=None, memory=None, budget=None):
+    # roi (x1, y1, x2, y2) limits all work to that region of the image, plus
+    # the halo the blurs need; the result is the region only. With a pool
+    # (not the executor's) independent stages overlap on it, and stats
+    # (a GraphStats) gets the time of every stage and the critical path.
+    # memory (a MemoryStats) gets the peak bytes of every stage; a render
+    # predicted to need more than budget bytes runs tiled (see plan_memory).
+    if image is None:
+        return None
+
+    if budget is not None or memory is not None:
+        shape = image.shape
+        if roi is not None:
+            shape = (roi[3] - roi[1], roi[2] - roi[0]) + image.shape[2:]
+        plan = plan_memory(recipe, shape, budget)
+        if memory is not None:
+            memory.mode = plan.mode
+            memory.estimate = plan.estimate
+        if plan.rows is not None:
+            return render_tiled(image, recipe, plan, bg_mask, executor, cache, roi, memory)
+
+    if pool is not None or stats is not None:
+        graph, last = render_graph(image, recipe, bg_mask, executor, cache, roi, memory)
+        return graph.run(pool, stats)[last]
+
+    base = segmentation_input(image, recipe, executor, cache, roi, memory)
+    if roi is not None:
+        recipe = dict(recipe, masks=[])
+    return render_tail(base, recipe, bg_mask, cache, memory)
+
+def mask_footprint(mask):
+    # Bounding box (x1, y1, x2, y2) of the pixels a mask touches, or None
+    x, y, w, h = cv2.boundingRect(mask)
+    return (x, y, x + w, y + h) if w and h else None
+
+def _union(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+def dirty_rect(old, new, shape):
+    # Source region where the renders of two recipes can differ, or None when
+    # the change is not local (anything but selective masks, or a global
+    # step like background removal after them)
+    if any(old[key] != new[key] for key in DEFAULT_RECIPE if key != "masks"):
+        return None
+    if has_global(new):
+        return None
+
+    old_ids = {id(m['mask']) for m in old["masks"]}
+    new_ids = {id(m['mask']) for m in new["masks"]}
+    changed = [m for m in old["masks"] if id(m['mask']) not in new_ids]
+    changed += [m for m in new["masks"] if id(m['mask']) not in old_ids]
+    if not changed:
+        return None
+
+    rect = None
+    for m in changed:
+        if m['mask'].shape[:2] != tuple(shape[:2]):
+            return None
+        rect = _union(rect, mask_footprint(m['mask']))
+    if rect is None:
+        return (0, 0, 0, 0)
+
+    # Masks that stay may blur over the changed pixels, so grow by their reach.
+    # Lens masks are local too: a lens pixel only moves where its depth does,
+    # and its blur levels come out the same in any window (see _level_in).
+    kept = dict(new, masks=[m for m in new["masks"] if id(m['mask']) in old_ids], gaussian=0, median=0)
+    grow = roi_halo(kept)
+    h, w = shape[:2]
+    return (max(0, rect[0] - grow), max(0, rect[1] - grow),
+            min(w, rect[2] + grow), min(h, rect[3] + grow))
+
+def render_region(image, recipe, previous, rect, roi=None, executor=None):
+    # Re-render only rect (source coordinates) into a copy of previous, the
+    # result of the same render over roi. Returns the new image and the
+    # updated box in its coordinates, or (previous, None) if nothing changed.
+    ox, oy = roi[:2] if roi is not None else (0, 0)
+    ex, ey = (roi[2], roi[3]) if roi is not None else (image.shape[1], image.shape[0])
+    x1, y1 = max(rect[0], ox), max(rect[1], oy)
+    x2, y2 = min(rect[2], ex), min(rect[3], ey)
+    if x2 <= x1 or y2 <= y1:
+        return previous, None
+
+    patch = render(image, recipe, executor=executor, roi=(x1, y1, x2, y2))
+    result = previous.copy()
+    box = (x1 - ox, y1 - oy, x2 - ox, y2 - oy)
+    result[box[1]:box[3], box[0]:box[2]] = patch
+    return result, box
+
+def split_geometry(ops):
+    # Leading crops can run before the filters as a region of interest,
+    # everything from the first resize on is replayed on the result
+    lead = 0
+    while lead < len(ops) and ops[lead]['op'] == 'crop':
+        lead += 1
+    return ops[:lead], ops[lead:]
+
+def crop_rect(crops, shape):
+    # Chain of crops as one rectangle of the source
+    h, w = shape[:2]
+    x1, y1, x2, y2 = 0, 0, w, h
+    for op in crops:
+        cx1, cy1, cx2, cy2 = op['rect']
+        x1, y1, x2, y2 = x1 + cx1, y1 + cy1, min(x2, x1 + cx2), min(y2, y1 + cy2)
+    return (x1, y1, x2, y2)
+
+def geometry_shapes(shape, ops):
+    # (h, w) before and after every step
+    shapes = [tuple(shape[:2])]
+    for op in ops:
+        h, w = shapes[-1]
+        if op['op'] == 'crop':
+            x1, y1, x2, y2 = op['rect']
+            shapes.append((min(y2, h) - y1, min(x2, w) - x1))
+        elif op['op'] == 'resize':
+            width, height = op['size']
+            if width is not None and height is not None:
+                shapes.append((height, width))
+            elif width is not None:
+                shapes.append((int(h * width / w), width))
+            elif height is not None:
+                shapes.append((height, int(w * height / h)))
+            else:
+                shapes.append((h, w))
+    return shapes
+
+def unapply_geometry(mask, ops, shape):
+    # Map a mask drawn on the cropped/resized result back onto the source
+    shapes = geometry_shapes(shape, ops)
+    for op, (h, w) in zip(reversed(ops), reversed(shapes[:-1])):
+        if op['op'] == 'crop':
+            x1, y1 = op['rect'][:2]
+            full = np.zeros((h, w), dtype=mask.dtype)
+            full[y1:y1 + mask.shape[0], x1:x1 + mask.shape[1]] = mask
+            mask = full
+        elif op['op'] == 'resize':
+            mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_LINEAR)
+    return mask
+
+def apply_geometry(image, ops):
+    # Crop ({'op': 'crop', 'rect': (x1, y1, x2, y2)}) and resize
+    # ({'op': 'resize', 'size': (w, h)}) steps, in the order they were made
+    for op in ops:
+        if op['op'] == 'crop':
+            x1, y1, x2, y2 = op['rect']
+            image = image[y1:y2, x1:x2]
+        elif op['op'] == 'resize':
+            image = resize_image(image, *op['size'])
+    return image
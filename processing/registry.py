@@ -0,0 +1,291 @@
+import threading
+import time
+import cv2
+import numpy as np
+from processing.blur import (
+    gaussian_blur, median_blur, apply_selective_blur, gaussian_kernel_size, median_kernel_size,
+    selective_kernel_size, lens_halo
+)
+from processing.light import adjust_darken, adjust_brighten
+from processing.tone import grayscale, black_white
+
+class FilterSpec:
+    # One registered operation and what the planner may assume about it.
+    #   value(recipe)   parameter for this op, None when it would be a no-op
+    #   func(image, v)  the operation itself
+    #   halo(v)         pixels of context it reads around each output pixel,
+    #                   0 for pointwise ops, None for global ones (whole image)
+    #   lut(v)          256 entry table when it is the same map on every color
+    #                   channel, so neighbours can be fused into one pass
+    #   linear(v)       linear in the pixel values (commutes with channel mixing)
+    #   commutes        names of ops it may be swapped with when both are
+    #                   linear, only if the swap gives the same pixels: every
+    #                   op rounds to uint8, so linear alone is not enough
+    #   reduces         turns a BGR image into a single plane
+    #   ns_per_px       cost per pixel and channel for work(v) == 1, see calibrate()
+    #   copies(v)       working memory at its peak besides the input, output
+    #                   included, in input sizes, see estimate_stage_bytes()
+    def __init__(self, name, value, func, halo=None, lut=None, linear=False, commutes=(),
+                 alpha_preserving=True, reduces=False, ns_per_px=1.0, work=None, sample=None,
+                 copies=None):
+        self.name = name
+        self.value = value
+        self.func = func
+        self.halo = halo or (lambda v: 0)
+        self.lut = lut
+        self.linear = linear if callable(linear) else (lambda v, flag=linear: flag)
+        self.commutes = set(commutes)
+        self.alpha_preserving = alpha_preserving
+        self.reduces = reduces
+        self.ns_per_px = ns_per_px
+        self.work = work or (lambda v: 1.0)
+        self.sample = sample
+        self.copies = copies or (lambda v: 1.0)
+
+    def pointwise(self, value):
+        return self.halo(value) == 0
+
+    def is_global(self, value):
+        return self.halo(value) is None
+
+# Registration order is the order the filters run in. Renders on other
+# threads read it through _filters(), a snapshot, so a late register() never
+# shows them a half-updated chain.
+FILTERS = []
+_filters_lock = threading.Lock()
+
+def _filters():
+    with _filters_lock:
+        return tuple(FILTERS)
+
+def register(spec, before=None):
+    # New filters go at the end of the chain, or right before another one
+    with _filters_lock:
+        if any(f.name == spec.name for f in FILTERS):
+            raise ValueError(f"Filter already registered: {spec.name}")
+        index = len(FILTERS)
+        if before is not None:
+            index = next(i for i, f in enumerate(FILTERS) if f.name == before)
+        FILTERS.insert(index, spec)
+    return spec
+
+def get_filter(name):
+    for spec in _filters():
+        if spec.name == name:
+            return spec
+    raise KeyError(name)
+
+def _offset_lut(offset):
+    return np.clip(np.arange(256) + offset, 0, 255).astype(np.uint8)
+
+def _selective_halo(masks):
+    halo = sum(selective_kernel_size(m['intensity']) // 2 for m in masks if m['blur_type'] != 'lens')
+    if any(m['blur_type'] == 'lens' for m in masks):
+        halo += lens_halo()
+    return halo
+
+def _selective_copies(masks):
+    # Result copy plus the float32 blend buffers over the largest mask box
+    # (lens: blur levels and weights over its depth area)
+    h, w = masks[0]['mask'].shape[:2]
+    copies = 1.0
+    for m in masks:
+        _, _, bw, bh = cv2.boundingRect(m['mask'])
+        per_px = 11.0 if m['blur_type'] == 'lens' else 9.0
+        copies = max(copies, 1.0 + per_px * bw * bh / (h * w))
+    return copies
+
+register(FilterSpec(
+    "gaussian", lambda r: r["gaussian"] or None, gaussian_blur,
+    halo=lambda v: gaussian_kernel_size(v) // 2, linear=True,
+    ns_per_px=0.4, work=lambda v: gaussian_kernel_size(v) ** 0.5, sample=30))
+register(FilterSpec(
+    "median", lambda r: r["median"] or None, median_blur,
+    halo=lambda v: median_kernel_size(v) // 2,
+    ns_per_px=1.5, work=lambda v: 1.0 if median_kernel_size(v) <= 5 else 8.0, sample=30))
+register(FilterSpec(
+    "selective", lambda r: r["masks"] or None, apply_selective_blur,
+    halo=_selective_halo,
+    linear=lambda masks: all(m['blur_type'] != 'median' for m in masks),
+    ns_per_px=1.0, work=lambda masks: len(masks), copies=_selective_copies))
+register(FilterSpec(
+    "darken", lambda r: r["darken"] or None, adjust_darken,
+    lut=lambda v: _offset_lut(-int(v * 2.55)), ns_per_px=0.3, sample=20))
+register(FilterSpec(
+    "brighten", lambda r: r["brighten"] or None, adjust_brighten,
+    lut=lambda v: _offset_lut(int(v * 2.55)), ns_per_px=0.3, sample=20))
+register(FilterSpec(
+    "grayscale", lambda r: True if r["grayscale"] else None, lambda image, v: grayscale(image),
+    # Commutes with nothing: blurring gray or graying a blur round differently
+    linear=True, reduces=True, ns_per_px=0.3, sample=True,
+    copies=lambda v: 1 / 3))
+register(FilterSpec(
+    # Only ever runs after grayscale, so every color channel holds the same gray
+    "blackwhite", lambda r: r["bw_threshold"] if r["grayscale"] and r["blackwhite"] else None,
+    black_white, lut=lambda v: np.where(np.arange(256) > v, 255, 0).astype(np.uint8),
+    ns_per_px=0.3, sample=127))
+
+# Background removal and the binary view work on whole image statistics;
+# they run in render_tail and are listed so the planner knows they are global.
+# Background copies include the BGRA result; GrabCut's graph is OpenCV's own
+# memory, measured from the process peak.
+register(FilterSpec(
+    "background", lambda r: r["background"], None, halo=lambda v: None,
+    alpha_preserving=False, ns_per_px=40.0,
+    work=lambda v: {"grabcut": 25.0, "simple": 0.05, "edge": 2.5, "edge_fast": 1.0}.get(v, 1.0),
+    copies=lambda v: {"grabcut": 70.0, "simple": 1.7, "edge": 3.7, "edge_fast": 2.1}.get(v, 2.0)))
+register(FilterSpec(
+    "binary", lambda r: True if r["binary"] else None, None, halo=lambda v: None,
+    ns_per_px=1.0, copies=lambda v: 5.5))
+
+class Step:
+    # One pass of a plan: a registered filter or several fused LUT filters
+    __slots__ = ("name", "run", "halo", "banded", "specs")
+
+    def __init__(self, name, run, halo, banded, specs):
+        self.name = name
+        self.run = run
+        self.halo = halo
+        self.banded = banded
+        self.specs = specs
+
+    def __repr__(self):
+        return f"Step({self.name}, halo={self.halo})"
+
+def _hoist_reducers(ops, channels):
+    # A channel reducer moves ahead of linear ops it commutes with (same
+    # pixels either way), so they run on one plane instead of three
+    if channels != 3:
+        return ops
+    ops = list(ops)
+    for i in range(len(ops)):
+        spec, value = ops[i]
+        if not spec.reduces:
+            continue
+        j = i
+        while j > 0:
+            prev, prev_value = ops[j - 1]
+            if (prev.name not in spec.commutes or not prev.linear(prev_value)
+                    or not spec.linear(value)):
+                break
+            ops[j - 1], ops[j] = ops[j], ops[j - 1]
+            j -= 1
+    return ops
+
+def _lut_step(group):
+    # Chain the tables in order: one lookup per pixel for the whole group
+    table = np.arange(256, dtype=np.uint8)
+    for spec, value in group:
+        table = spec.lut(value)[table]
+    specs = [spec for spec, _ in group]
+    tables = {}
+
+    def run(image):
+        if len(image.shape) == 3 and image.shape[2] == 4:
+            # Alpha keeps its identity entry
+            if 4 not in tables:
+                ident = np.arange(256, dtype=np.uint8)
+                tables[4] = np.stack([table, table, table, ident], axis=1).reshape(1, 256, 4)
+            return cv2.LUT(image, tables[4])
+        return cv2.LUT(image, table)
+
+    name = "+".join(spec.name for spec in specs)
+    return Step(f"lut({name})", run, 0, True, specs)
+
+def _spec_step(spec, value, executor):
+    if spec.name == "selective":
+        # Parallel inside, per mask ROI
+        return Step(spec.name, lambda image: spec.func(image, value, executor),
+                    spec.halo(value), False, [spec])
+    return Step(spec.name, lambda image: spec.func(image, value), spec.halo(value), True, [spec])
+
+def planned_ops(recipe, channels):
+    # Active local ops in run order, no-ops dropped and reducers hoisted
+    ops = []
+    for spec in _filters():
+        value = spec.value(recipe)
+        if value is None or spec.is_global(value):
+            continue
+        ops.append((spec, value))
+    return _hoist_reducers(ops, channels)
+
+def plan_recipe(recipe, channels=3, executor=None):
+    # Steps before background removal, with no-ops dropped, channel reducers
+    # moved ahead of ops they commute with and neighbouring lookup-table ops fused
+    ops = planned_ops(recipe, channels)
+
+    steps = []
+    group = []
+    for spec, value in ops:
+        if spec.lut is not None and spec.alpha_preserving:
+            group.append((spec, value))
+            continue
+        if group:
+            steps.append(_lut_step(group) if len(group) > 1 else _spec_step(*group[0], executor))
+            group = []
+        steps.append(_spec_step(spec, value, executor))
+    if group:
+        steps.append(_lut_step(group) if len(group) > 1 else _spec_step(*group[0], executor))
+    return steps
+
+def plan_halo(steps):
+    # Context a region needs so the steps give the same pixels as a full render
+    return sum(step.halo for step in steps)
+
+def has_global(recipe):
+    return any(spec.is_global(v) for spec in _filters()
+               if (v := spec.value(recipe)) is not None)
+
+def estimate_seconds(recipe, shape):
+    # Cost model: per pixel and channel coefficient times the op's work factor
+    pixels = shape[0] * shape[1]
+    channels = shape[2] if len(shape) == 3 else 1
+    ops = planned_ops(recipe, channels)
+    ops += [(spec, v) for spec in _filters()
+            if (v := spec.value(recipe)) is not None and spec.is_global(v)]
+    total = 0.0
+    for spec, value in ops:
+        total += spec.ns_per_px * spec.work(value) * pixels * channels
+        if spec.reduces and channels == 3:
+            channels = 1
+    return total * 1e-9
+
+def estimate_stage_bytes(recipe, shape):
+    # (op name, peak bytes, output bytes) of every op render() runs on an
+    # image of shape, in order. The peak counts the source the caller holds,
+    # the op's input and its working buffers, so the largest one predicts
+    # the peak of the whole render.
+    h, w = shape[:2]
+    channels = shape[2] if len(shape) == 3 else 1
+    source = h * w * channels
+    ops = planned_ops(recipe, channels)
+    ops += [(spec, v) for spec in _filters()
+            if (v := spec.value(recipe)) is not None and spec.is_global(v)]
+    stages = []
+    for spec, value in ops:
+        size = h * w * channels
+        if spec.reduces and channels == 3:
+            channels = 1
+        elif spec.name == "background":
+            channels = 4
+        elif spec.name == "binary":
+            channels = 3
+        peak = source + size + int(size * spec.copies(value))
+        stages.append((spec.name, peak, h * w * channels))
+    return stages
+
+def calibrate(size=(1024, 1024), repeats=3):
+    # Fit each filter's ns_per_px on this machine from a synthetic photo
+    rng = np.random.default_rng(0)
+    image = cv2.GaussianBlur(rng.integers(0, 256, size + (3,), dtype=np.uint8), (0, 0), 2)
+    pixels = size[0] * size[1] * 3
+    for spec in _filters():
+        if spec.func is None or spec.sample is None:
+            continue
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            spec.func(image, spec.sample)
+            best = min(best, time.perf_counter() - start)
+        spec.ns_per_px = best * 1e9 / (pixels * spec.work(spec.sample))
+    return {spec.name: spec.ns_per_px for spec in _filters()}
@@ -1,11 +1,16 @@
+import queue
+import threading
 import cv2
 import numpy as np
 from utils.image_io import resize_with_alpha 
+from processing.luma import LumaPlane
 
 # Background Removal Functions
-def remove_background_grabcut(image):
+def grabcut_steps(image, iterations=5):
+    # GrabCut one iteration at a time: yields the 0/255 mask after each
+    # pass, so a caller can show progress, stop early or give up
     if image is None:
-        return None
+        return
 
     mask = np.zeros(image.shape[:2], np.uint8)
     
@@ -15,39 +20,123 @@ def remove_background_grabcut(image):
     rect = (int(width * 0.1), int(height * 0.1), 
             int(width * 0.8), int(height * 0.8))
     
-    # Apply GrabCut
-    cv2.grabCut(image, mask, rect, bgd_model, fgd_model, 5, cv2.GC_INIT_WITH_RECT)
+    # First pass seeds the models from the rectangle, later ones carry on
+    # from the models and mask (GC_EVAL)
+    mode = cv2.GC_INIT_WITH_RECT
+    for _ in range(iterations):
+        cv2.grabCut(image, mask, rect, bgd_model, fgd_model, 1, mode)
+        mode = cv2.GC_EVAL
+        yield np.where((mask == 2) | (mask == 0), 0, 255).astype('uint8')
+
+def grabcut_mask(image, iterations=5):
+    if image is None:
+        return None
+
+    result = None
+    for result in grabcut_steps(image, iterations):
+        pass
+    return result
+
+class GrabCutJob:
+    # grabcut_steps() on a worker thread. Each pass posts
+    # ("progress", mask, iteration, changed) to updates, where changed is the
+    # fraction of pixels that flipped since the last pass; the run ends with
+    # ("done", mask), ("cancelled", None) or ("error", message). Below
+    # tolerance the mask counts as settled and the job stops early.
+    def __init__(self, image, iterations=5, tolerance=0.001):
+        self.image = image
+        self.iterations = iterations
+        self.tolerance = tolerance
+        self.updates = queue.Queue()
+        self.mask = None
+        self._cancel = threading.Event()
+        self._accept = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self._cancel.set()
+
+    def accept(self):
+        # Keep the latest mask and stop after the running pass
+        self._accept.set()
+
+    def _run(self):
+        try:
+            for i, mask in enumerate(grabcut_steps(self.image, self.iterations), 1):
+                if self._cancel.is_set():
+                    break
+                changed = 1.0
+                if self.mask is not None:
+                    changed = np.count_nonzero(mask != self.mask) / mask.size
+                self.mask = mask
+                self.updates.put(("progress", mask, i, changed))
+                if self._accept.is_set() or changed < self.tolerance:
+                    break
+        except cv2.error as e:
+            self.updates.put(("error", str(e)))
+            return
+        if self._cancel.is_set() or self.mask is None:
+            self.updates.put(("cancelled", None))
+        else:
+            self.updates.put(("done", self.mask))
+
+def apply_alpha_mask(image, mask, clear_background=False):
+    if image is None or mask is None:
+        return None
     
-    mask2 = np.where((mask == 2) | (mask == 0), 0, 1).astype('uint8')
-    foreground = image * mask2[:, :, np.newaxis]
+    # Attach mask as the alpha channel (RGBA)
+    rgba = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+    rgba[:, :, 3] = mask
     
-    # Create transparent background (RGBA)
-    b_channel, g_channel, r_channel = cv2.split(foreground)
-    alpha_channel = (mask2 * 255).astype(np.uint8)
-    rgba_image = cv2.merge((b_channel, g_channel, r_channel, alpha_channel))
+    # Zero the color of removed pixels as well
+    if clear_background:
+        rgba[mask == 0] = 0
     
-    return rgba_image
+    return rgba
 
-def remove_background_simple(image, threshold=240):
+def remove_background_grabcut(image):
     if image is None:
         return None
     
-    # Convert to grayscale for thresholding
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    # Create transparent background (RGBA)
+    return apply_alpha_mask(image, grabcut_mask(image), clear_background=True)
+
+def simple_mask(image, threshold=240, luma=None):
+    if image is None:
+        return None
+    
+    # Grayscale for thresholding, cached by the caller if possible
+    if luma is None:
+        luma = LumaPlane(image)
     
     # Create mask
-    _, mask = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY_INV)
+    mask = luma.threshold(threshold, inverse=True)
     
     # Apply morphological operations to clean up mask
     kernel = np.ones((3, 3), np.uint8)
     mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
     mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-    b, g, r = cv2.split(image)
-    rgba = cv2.merge((b, g, r, mask))
     
-    return rgba
+    return mask
 
-def remove_background_edge(image):
+def remove_background_simple(image, threshold=240, luma=None):
+    if image is None:
+        return None
+    
+    return apply_alpha_mask(image, simple_mask(image, threshold, luma))
+
+def _auto_canny_thresholds(gray, sigma=0.33):
+    # Pick Canny thresholds around the median intensity
+    median = float(np.median(gray))
+    lower = int(max(0, (1.0 - sigma) * median))
+    upper = int(min(255, (1.0 + sigma) * median))
+    return lower, max(upper, lower + 1)
+
+def edge_mask(image, auto_canny=False):
     if image is None:
         return None
     
@@ -56,7 +145,8 @@ def remove_background_edge(image):
     
     # Apply Gaussian blur to reduce noise
     blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    edges = cv2.Canny(blurred, 30, 100)
+    low, high = _auto_canny_thresholds(blurred) if auto_canny else (30, 100)
+    edges = cv2.Canny(blurred, low, high)
     kernel = np.ones((3, 3), np.uint8)
     dilated = cv2.dilate(edges, kernel, iterations=2)
 
@@ -71,33 +161,114 @@ def remove_background_edge(image):
     # Apply morphological operations to clean mask
     mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
     mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-    b, g, r = cv2.split(image)
-    rgba = cv2.merge((b, g, r, mask))
     
-    return rgba
+    return mask
+
+def remove_background_edge(image, auto_canny=False):
+    if image is None:
+        return None
+    
+    return apply_alpha_mask(image, edge_mask(image, auto_canny))
+
+def edge_mask_multiscale(image, max_side=512, band=6, auto_canny=False):
+    if image is None:
+        return None
+    
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    h, w = gray.shape
+    
+    # Go down the pyramid until the longest side fits max_side
+    small = gray
+    while max(small.shape) > max_side:
+        small = cv2.pyrDown(small)
+    
+    # Small images gain nothing from the pyramid
+    if small is gray:
+        return edge_mask(image, auto_canny)
+    
+    # Find the dominant contour on the small level
+    blurred = cv2.GaussianBlur(small, (5, 5), 0)
+    low, high = _auto_canny_thresholds(blurred) if auto_canny else (30, 100)
+    edges = cv2.Canny(blurred, low, high)
+    kernel = np.ones((3, 3), np.uint8)
+    dilated = cv2.dilate(edges, kernel, iterations=2)
+    
+    contours, _ = cv2.findContours(dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    small_mask = np.zeros_like(small)
+    if contours:
+        largest_contour = max(contours, key=cv2.contourArea)
+        cv2.drawContours(small_mask, [largest_contour], -1, 255, -1)
+    
+    # Clean the mask while it is still small
+    small_mask = cv2.morphologyEx(small_mask, cv2.MORPH_CLOSE, kernel)
+    small_mask = cv2.morphologyEx(small_mask, cv2.MORPH_OPEN, kernel)
+    
+    # Scale back up, smooth edges come from the linear interpolation
+    mask = cv2.resize(small_mask, (w, h), interpolation=cv2.INTER_LINEAR)
+    _, mask = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
+    
+    # Refine only a thin band around the boundary at full resolution
+    scale = w / small.shape[1]
+    radius = max(1, int(np.ceil(band / scale)))
+    band_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * radius + 1, 2 * radius + 1))
+    inner = cv2.erode(small_mask, band_kernel)
+    outer = cv2.dilate(small_mask, band_kernel)
+    
+    if cv2.countNonZero(inner) > 0 and cv2.countNonZero(outer) < outer.size:
+        fg_mean = cv2.mean(small, mask=inner)[0]
+        bg_mean = cv2.mean(small, mask=cv2.bitwise_not(outer))[0]
+        
+        # Skip refinement when foreground and background look alike
+        if abs(fg_mean - bg_mean) >= 10:
+            small_band = cv2.subtract(outer, inner)
+            bx, by, bw, bh = cv2.boundingRect(small_band)
+            
+            # Band bounding box in full resolution coordinates
+            x1, y1 = int(bx * scale), int(by * scale)
+            x2, y2 = min(w, int((bx + bw) * scale)), min(h, int((by + bh) * scale))
+            band_roi = cv2.resize(small_band[by:by + bh, bx:bx + bw], (x2 - x1, y2 - y1),
+                                  interpolation=cv2.INTER_NEAREST)
+            
+            # Nearest mean classification is a threshold halfway between the means
+            midpoint = (fg_mean + bg_mean) / 2
+            mode = cv2.THRESH_BINARY if fg_mean > bg_mean else cv2.THRESH_BINARY_INV
+            _, refined = cv2.threshold(gray[y1:y2, x1:x2], midpoint, 255, mode)
+            refined = cv2.medianBlur(refined, 3)
+            
+            mask_roi = mask[y1:y2, x1:x2]
+            cv2.copyTo(refined, band_roi, mask_roi)
+    
+    return mask
+
+def remove_background_edge_multiscale(image, max_side=512, band=6, auto_canny=False):
+    if image is None:
+        return None
+    
+    return apply_alpha_mask(image, edge_mask_multiscale(image, max_side, band, auto_canny))
 
 # Resizing Functions
 def resize_image(image, width=None, height=None):
     return resize_with_alpha(image, width, height)
 
+# Social media and screen sizes (width, height)
+PRESETS = {
+    "instagram": (1080, 1080),
+    "facebook": (1200, 630),
+    "twitter": (1200, 675),
+    "hd": (1280, 720),
+    "full_hd": (1920, 1080),
+    "4k": (3840, 2160)
+}
+
 def resize_to_preset(image, preset_name):
-    presets = {
-        "instagram": (1080, 1080),
-        "facebook": (1200, 630),
-        "twitter": (1200, 675),
-        "hd": (1280, 720),
-        "full_hd": (1920, 1080),
-        "4k": (3840, 2160)
-    }
-    
-    if preset_name in presets:
-        width, height = presets[preset_name]
+    if preset_name in PRESETS:
+        width, height = PRESETS[preset_name]
         return resize_image(image, width, height)
     
     return image
 
 # Binarization Functions
-def show_binary_mask(image, threshold_method="otsu"):
+def show_binary_mask(image, threshold_method="otsu", luma=None):
     if image is None:
         return None
     
@@ -112,16 +283,17 @@ def show_binary_mask(image, threshold_method="otsu"):
     else:
         color_img = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
     
-    # Convert to grayscale for thresholding
-    gray = cv2.cvtColor(color_img, cv2.COLOR_BGR2GRAY)
+    # Grayscale and histogram for thresholding, cached by the caller if possible
+    if luma is None:
+        luma = LumaPlane(color_img)
     
     # Apply thresholding method
     if threshold_method == "otsu":
-        # Automatic thresholding
-        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        # Automatic thresholding from the histogram
+        binary = luma.threshold(luma.otsu)
     else:
         # Manual threshold
-        _, binary = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
+        binary = luma.threshold(127)
     
     # Create red overlay for foreground
     overlay = color_img.copy()
@@ -133,20 +305,13 @@ def show_binary_mask(image, threshold_method="otsu"):
     
     return result
 
-def get_binary_mask(image, threshold=127):
+def get_binary_mask(image, threshold=127, luma=None):
     if image is None:
         return None
     
-    # Convert to grayscale
-    if len(image.shape) == 3:
-        if image.shape[2] == 4:  # RGBA
-            gray = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
-        else:  # BGR
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = image.copy()
+    # Convert to grayscale (RGBA, BGR or already gray)
+    if luma is None:
+        luma = LumaPlane(image)
     
     # Apply threshold
-    _, binary = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)
-    
-    return binary
\ No newline at end of file
+    return luma.threshold(threshold)
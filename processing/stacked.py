@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+from processing.pipeline import render, render_tail
+from processing.registry import planned_ops, has_global
+
+# Images up to this many pixels are worth stacking, bigger ones have enough
+# pixel work to hide the per-call overhead
+STACK_MAX_PIXELS = 512 * 512
+
+def _tall(stack):
+    # N x H x W x C as one (N*H) x W image, pointwise ops cannot tell the difference
+    n, h = stack.shape[:2]
+    return stack.reshape((n * h,) + stack.shape[2:])
+
+def _lut_table(group, channels):
+    table = np.arange(256, dtype=np.uint8)
+    for spec, value in group:
+        table = spec.lut(value)[table]
+    if channels == 4:
+        # Alpha keeps its identity entry
+        ident = np.arange(256, dtype=np.uint8)
+        return np.stack([table, table, table, ident], axis=1).reshape(1, 256, 4)
+    return table
+
+def _per_image(stack, func):
+    # Spatial ops see one image at a time, written straight into one output stack
+    first = func(stack[0])
+    out = np.empty((len(stack),) + first.shape, first.dtype)
+    out[0] = first
+    for i in range(1, len(stack)):
+        out[i] = func(stack[i])
+    return out
+
+def render_stack(stack, recipe):
+    # Same result as render() on every image of an N x H x W x C stack
+    # (recipe masks, if any, must match one image). Lookup-table ops and the
+    # BGR to gray conversion run once over the whole stack.
+    channels = stack.shape[3] if stack.ndim == 4 else 1
+    ops = planned_ops(recipe, channels)
+
+    i = 0
+    while i < len(ops):
+        spec, value = ops[i]
+        if spec.lut is not None and spec.alpha_preserving:
+            group = [ops[i]]
+            while i + 1 < len(ops) and ops[i + 1][0].lut is not None:
+                i += 1
+                group.append(ops[i])
+            stack = cv2.LUT(_tall(stack), _lut_table(group, channels)).reshape(stack.shape)
+        elif spec.reduces and channels == 3:
+            n, h, w = stack.shape[:3]
+            stack = cv2.cvtColor(_tall(stack), cv2.COLOR_BGR2GRAY).reshape(n, h, w)
+            channels = 1
+        else:
+            stack = _per_image(stack, lambda image: spec.func(image, value))
+        channels = stack.shape[3] if stack.ndim == 4 else 1
+        i += 1
+
+    if not has_global(recipe):
+        return stack
+    return [render_tail(image, recipe) for image in stack]
+
+def stackable(recipe, channels=3):
+    # Only lookup-table and channel reducing recipes gain from a stack: a
+    # spatial op still runs one image at a time (median came out slower)
+    if has_global(recipe):
+        return False
+    return all(spec.lut is not None or spec.reduces for spec, _ in planned_ops(recipe, channels))
+
+def render_many(images, recipe, max_pixels=STACK_MAX_PIXELS):
+    # render() for a list of images: small ones of the same shape are stacked
+    results = [None] * len(images)
+    groups = {}
+    for index, image in enumerate(images):
+        if image.shape[0] * image.shape[1] <= max_pixels:
+            groups.setdefault((image.shape, image.dtype.str), []).append(index)
+        else:
+            results[index] = render(image, recipe)
+
+    for indices in groups.values():
+        if len(indices) == 1:
+            results[indices[0]] = render(images[indices[0]], recipe)
+            continue
+        stack = np.stack([images[i] for i in indices])
+        for i, result in zip(indices, render_stack(stack, recipe)):
+            results[i] = result
+    return results
@@ -0,0 +1,129 @@
+import queue
+import threading
+import time
+from collections import deque
+import cv2
+import numpy as np
+from processing.pipeline import render_base, render_tail, background_mask
+from utils.video_io import read_frames, source_fps, open_sink
+
+_DONE = object()
+
+def threaded(iterable, maxsize=4):
+    # Run a generator in its own thread, handing items over a bounded queue
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def worker():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                items.put(item)
+            items.put(_DONE)
+        except BaseException as e:
+            items.put(e)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # Unblock the producer if the consumer stopped early
+        stop.set()
+        while thread.is_alive():
+            try:
+                items.get_nowait()
+            except queue.Empty:
+                thread.join(0.01)
+
+class StreamStats:
+    def __init__(self, window=30):
+        self.frames = 0
+        self.masks_computed = 0
+        self.masks_reused = 0
+        # Inputs that could not be decoded or rendered
+        self.failed = 0
+        self.start = None
+        self.end = None
+        self.stamps = deque(maxlen=window)
+
+    def tick(self):
+        now = time.perf_counter()
+        if self.start is None:
+            self.start = now
+        self.end = now
+        self.frames += 1
+        self.stamps.append(now)
+
+    @property
+    def fps(self):
+        # Average over the whole run
+        if self.frames < 2:
+            return 0.0
+        return (self.frames - 1) / max(self.end - self.start, 1e-9)
+
+    @property
+    def sustained_fps(self):
+        # Rate over the last window of frames, ignores start-up cost
+        if len(self.stamps) < 2:
+            return 0.0
+        return (len(self.stamps) - 1) / max(self.stamps[-1] - self.stamps[0], 1e-9)
+
+def _thumbnail(image, width=64):
+    if len(image.shape) == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    h, w = image.shape[:2]
+    return cv2.resize(image, (width, max(1, h * width // w)), interpolation=cv2.INTER_AREA)
+
+def process_frames(frames, recipe, reuse_threshold=2.0, max_reuse=30, stats=None):
+    # Segmentation masks are reused while the scene stays static
+    method = recipe["background"]
+    mask = None
+    mask_thumb = None
+    reused = 0
+
+    for frame in frames:
+        base = render_base(frame, recipe)
+
+        if method is not None:
+            thumb = _thumbnail(base)
+            static = (mask is not None and mask.shape == base.shape[:2]
+                      and reused < max_reuse
+                      and float(np.mean(cv2.absdiff(thumb, mask_thumb))) < reuse_threshold)
+            if static:
+                reused += 1
+                if stats is not None:
+                    stats.masks_reused += 1
+            else:
+                mask = background_mask(base, method, recipe["bg_threshold"])
+                mask_thumb = thumb
+                reused = 0
+                if stats is not None:
+                    stats.masks_computed += 1
+
+        yield render_tail(base, recipe, mask)
+
+def run_stream(source, destination, recipe, queue_size=4, reuse_threshold=2.0, report=None):
+    # Reader and compute run in their own threads, the caller writes
+    stats = StreamStats()
+    sink = open_sink(destination, source_fps(source))
+
+    frames = threaded(read_frames(source), queue_size)
+    results = threaded(process_frames(frames, recipe, reuse_threshold, stats=stats), queue_size)
+    try:
+        for result in results:
+            sink.write(result)
+            stats.tick()
+            if report is not None and stats.frames % 30 == 0:
+                report(stats)
+    finally:
+        sink.close()
+
+    return stats
@@ -0,0 +1,137 @@
+import cv2
+import numpy as np
+from processing.parallel import ImagePool
+from processing.pipeline import DEFAULT_RECIPE, background_mask, render_tail, masks_key
+from processing.registry import planned_ops
+
+# Longest side of a sweep preview, about what one contact sheet cell shows
+SWEEP_MAX_SIDE = 480
+
+def sweep_recipes(recipe, key, values):
+    # One recipe per value of key, everything else as in recipe
+    if key not in DEFAULT_RECIPE or key == "masks":
+        raise ValueError(f"Cannot sweep recipe key: {key}")
+    return [dict(recipe, **{key: value}) for value in values]
+
+def _scaled(value, scale):
+    # Blur strength in source pixels at preview scale; on stays on
+    return max(1, round(value * scale)) if value else 0
+
+def _preview(image, recipes, max_side):
+    # Image and recipes at preview size. Blur reach shrinks with the image so
+    # the preview looks like the full render scaled down. Masks are resized
+    # once each, so recipes that shared a mask still share it.
+    h, w = image.shape[:2]
+    scale = min(1.0, max_side / max(h, w)) if max_side else 1.0
+    if scale == 1.0:
+        return image, recipes
+
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    small = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    masks = {}
+    for recipe in recipes:
+        for m in recipe["masks"]:
+            if id(m['mask']) not in masks:
+                masks[id(m['mask'])] = cv2.resize(m['mask'], size, interpolation=cv2.INTER_NEAREST)
+
+    scaled = []
+    for recipe in recipes:
+        scaled.append(dict(recipe,
+                           gaussian=_scaled(recipe["gaussian"], scale),
+                           median=_scaled(recipe["median"], scale),
+                           masks=[dict(m, mask=masks[id(m['mask'])],
+                                       intensity=_scaled(m['intensity'], scale))
+                                  for m in recipe["masks"]]))
+    return small, scaled
+
+def _op_key(spec, value):
+    return (spec.name, masks_key(value) if spec.name == "selective" else value)
+
+def _run_op(item, outputs):
+    prefix, (spec, value) = item
+    return spec.func(outputs[prefix[:-1]], value)
+
+def render_sweep(image, recipes, max_side=SWEEP_MAX_SIDE, pool=None):
+    # render() of every recipe, at preview size unless max_side is None.
+    # The filter chains form a tree: steps the recipes share from the start
+    # of the chain (decode, global blur, gray plane) run once and each level
+    # fans out on the pool. Background masks run once per distinct input,
+    # then the per-variant tails run in parallel.
+    own_pool = pool is None
+    pool = pool or ImagePool()
+    try:
+        small, recipes = _preview(image, recipes, max_side)
+        channels = small.shape[2] if small.ndim == 3 else 1
+        chains = [planned_ops(recipe, channels) for recipe in recipes]
+        keys = [tuple(_op_key(*op) for op in chain) for chain in chains]
+
+        outputs = {(): small}
+        depth = 0
+        while True:
+            level = {}
+            for chain, key in zip(chains, keys):
+                if len(chain) > depth and key[:depth + 1] not in outputs:
+                    level[key[:depth + 1]] = chain[depth]
+            if not level:
+                break
+            items = list(level.items())
+            outputs.update(zip(level, pool.map(_run_op, items, outputs)))
+            depth += 1
+
+        # Segmentation is the expensive global step, one per (input, method)
+        wanted = {}
+        for i, (recipe, key) in enumerate(zip(recipes, keys)):
+            method = recipe["background"]
+            if method is not None:
+                threshold = recipe["bg_threshold"] if method == "simple" else None
+                wanted.setdefault((key, method, threshold), []).append(i)
+        bg_masks = [None] * len(recipes)
+        jobs = list(wanted)
+        results = pool.map(lambda job: background_mask(outputs[job[0]], job[1], job[2]),
+                           jobs)
+        for job, mask in zip(jobs, results):
+            for i in wanted[job]:
+                bg_masks[i] = mask
+
+        return pool.map(lambda i: render_tail(outputs[keys[i]], recipes[i], bg_masks[i]),
+                        range(len(recipes)))
+    finally:
+        if own_pool:
+            pool.close()
+
+def _cell(image, side):
+    # BGR cell of at most side x side, transparency shown on dark gray
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    elif image.shape[2] == 4:
+        alpha = image[:, :, 3:].astype(np.float32) / 255
+        image = (image[:, :, :3] * alpha + 48 * (1 - alpha)).astype(np.uint8)
+    h, w = image.shape[:2]
+    scale = min(1.0, side / max(h, w))
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, round(w * scale)), max(1, round(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+    return image
+
+def contact_sheet(images, labels=None, columns=None, side=240, gap=6, label_height=18):
+    # Grid of images with a caption under each. Returns the sheet and the
+    # (x1, y1, x2, y2) box of every cell, for picking one with the mouse.
+    columns = columns or int(np.ceil(np.sqrt(len(images))))
+    rows = int(np.ceil(len(images) / columns))
+    pitch_x = side + gap
+    pitch_y = side + label_height + gap
+    sheet = np.full((rows * pitch_y + gap, columns * pitch_x + gap, 3), 30, np.uint8)
+
+    boxes = []
+    for i, image in enumerate(images):
+        cell = _cell(image, side)
+        h, w = cell.shape[:2]
+        x = gap + (i % columns) * pitch_x + (side - w) // 2
+        y = gap + (i // columns) * pitch_y + (side - h) // 2
+        sheet[y:y + h, x:x + w] = cell
+        boxes.append((x, y, x + w, y + h))
+        if labels is not None:
+            cv2.putText(sheet, str(labels[i]), (gap + (i % columns) * pitch_x + 2,
+                        gap + (i // columns) * pitch_y + side + label_height - 5),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.45, (220, 220, 220), 1, cv2.LINE_AA)
+    return sheet, boxes
@@ -1,5 +1,6 @@
 import cv2
 import numpy as np
+from processing.luma import LumaPlane
 
 #convert to grayscale
 def grayscale(image):
@@ -15,25 +16,17 @@ def grayscale(image):
         return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
 #convert to b&w
-def black_white(image, threshold):
+def black_white(image, threshold, luma=None):
+    # Reuse the cached gray plane when the caller has one
+    if luma is None:
+        luma = LumaPlane(image)
+    
+    # Apply threshold
+    bw = luma.threshold(threshold)
+    
     # Check image
     if len(image.shape) == 3 and image.shape[2] == 4:
-        # Convert RGBA to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
-        b, g, r, a = cv2.split(image)
-        
-        # Apply threshold
-        _, bw = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)
-        
-        # Merge B&W
-        return cv2.merge([bw, bw, bw, a])
+        # Merge B&W with the original alpha
+        return cv2.merge([bw, bw, bw, image[:, :, 3]])
     else:
-        # Convert to grayscale first 
-        if len(image.shape) == 3:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = image.copy()
-        
-        # Apply threshold
-        _, bw = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)
         return bw
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+from processing.pipeline import parse_recipe_values, render
+from utils.image_io import decode_image, encode_image
+from utils.result_cache import render_cached, is_png
+
+FORMATS = {"png": (".png", "image/png"), "jpg": (".jpg", "image/jpeg"),
+           "jpeg": (".jpg", "image/jpeg"), "bmp": (".bmp", "image/bmp")}
+
+class RenderService:
+    # Bounded worker pool with a cap on queued work, extra requests are shed
+    def __init__(self, workers=None, max_queue=None, cache=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = self.workers * 2 if max_queue is None else max_queue
+        self.pool = ThreadPoolExecutor(self.workers)
+        self.cache = cache
+        self.slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.served = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def submit(self, data, recipe, ext):
+        # Returns (encoded bytes, ext), or None when the queue is full
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            return None
+
+        with self.lock:
+            self.in_flight += 1
+        try:
+            return self.pool.submit(self._render, data, recipe, ext).result()
+        except Exception:
+            with self.lock:
+                self.failed += 1
+            raise
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+            self.slots.release()
+
+    def _render(self, data, recipe, ext):
+        # Decode and encode run in the worker too, they cost as much as the filters
+        if self.cache is not None:
+            # Keyed on the request body, so a hit skips decoding as well
+            digest = hashlib.sha256(data).hexdigest()
+            encoded = render_cached(self.cache, lambda: decode_image(data), recipe, ext, digest)
+            if is_png(encoded):
+                ext = ".png"
+        else:
+            result = render(decode_image(data), recipe)
+            if result.shape[-1:] == (4,) and ext != ".png":
+                ext = ".png"
+            encoded = encode_image(result, ext)
+        with self.lock:
+            self.served += 1
+        return encoded, ext
+
+    def stats(self):
+        with self.lock:
+            stats = {"workers": self.workers, "max_queue": self.max_queue,
+                     "in_flight": self.in_flight, "served": self.served,
+                     "rejected": self.rejected, "failed": self.failed}
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+    def close(self):
+        self.pool.shutdown()
+
+class RenderHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections alive between requests
+    protocol_version = "HTTP/1.1"
+    max_body = 256 * 2**20
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _reply(self, status, body, content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message, headers=None):
+        self._reply(status, json.dumps({"error": message}).encode(), headers=headers)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/health":
+            self._reply(200, json.dumps(self.server.service.stats()).encode())
+        else:
+            self._error(404, "Not found")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        if url.path != "/render":
+            self.rfile.read(length)
+            return self._error(404, "Not found")
+        if length <= 0 or length > self.max_body:
+            self.close_connection = True
+            return self._error(413 if length > 0 else 400, "Missing or oversized image body")
+
+        data = self.rfile.read(length)
+        try:
+            params = dict(parse_qsl(url.query))
+            ext, _ = FORMATS[params.pop("format", "png").lower()]
+            recipe = parse_recipe_values(params)
+        except (KeyError, ValueError) as e:
+            return self._error(400, f"Bad parameters: {e}")
+
+        try:
+            result = self.server.service.submit(data, recipe, ext)
+        except ValueError as e:
+            return self._error(400, str(e))
+        except Exception as e:
+            return self._error(500, f"Render failed: {e}")
+
+        if result is None:
+            return self._error(503, "Busy, try again", {"Retry-After": "1"})
+
+        encoded, ext = result
+        content_type = next(t for e, t in FORMATS.values() if e == ext)
+        self._reply(200, encoded, content_type)
+
+class RenderServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, verbose=False):
+        super().__init__(address, RenderHandler)
+        self.service = service
+        self.verbose = verbose
+
+def serve(host="127.0.0.1", port=8080, workers=None, max_queue=None, verbose=False,
+          cache=None):
+    service = RenderService(workers, max_queue, cache)
+    server = RenderServer((host, port), service, verbose)
+    print(f"Snappic service on http://{host}:{server.server_port} "
+          f"({service.workers} workers, queue {service.max_queue})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -1,18 +1,55 @@
+import os
+import queue
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import cv2
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, simpledialog
 from utils.image_io import load_image, save_image, cv_to_tk
-from processing.blur import gaussian_blur, median_blur
-from processing.tone import grayscale, black_white
-from processing.light import adjust_darken, adjust_brighten
-from processing.segmentation import (
-    remove_background_grabcut, remove_background_simple, remove_background_edge,
-    resize_image, resize_to_preset, show_binary_mask, get_binary_mask
+from processing.segmentation import GrabCutJob, resize_image, resize_to_preset
+from processing.pipeline import (
+    render, apply_geometry, split_geometry, crop_rect, unapply_geometry, RenderCache,
+    dirty_rect, render_region, segmentation_input, mask_key
 )
+from processing.parallel import BandExecutor
+from processing.graph import GraphStats
+from processing.memory import MemoryStats, default_render_budget
+from processing.export import export_presets
+from processing.sweep import render_sweep, sweep_recipes, contact_sheet
+from utils.history import EditHistory
+from utils.pixel_cache import PixelCache
+from ui.session import Session
+from ui.state import EditState, StateField
+
+# Values the variant sweep can step through: recipe key, slider, range
+SWEEP_PARAMS = {
+    "Gaussian Blur": ("gaussian", "gaussian_slider", 0, 100),
+    "Median Blur": ("median", "median_slider", 0, 100),
+    "Darken": ("darken", "darken_slider", 0, 100),
+    "Brighten": ("brighten", "brighten_slider", 0, 100),
+    "B&W Threshold": ("bw_threshold", "bw_slider", 0, 255),
+    "BG Threshold": ("bg_threshold", "bg_threshold_slider", 200, 255),
+}
 
 # ---- DEFINE THE PARAMETERS ----
 class SnappicApp(tk.Tk):
+    # Edit values are fields of one immutable EditState (self.edit_state);
+    # assigning one of these swaps in a new state
+    gaussian_value = StateField('gaussian_value')
+    median_value = StateField('median_value')
+    darken_value = StateField('darken_value')
+    brighten_value = StateField('brighten_value')
+    is_grayscale = StateField('is_grayscale')
+    is_blackwhite = StateField('is_blackwhite')
+    bw_threshold = StateField('bw_threshold')
+    bg_threshold = StateField('bg_threshold')
+    show_binary = StateField('show_binary')
+    has_background_removed = StateField('has_background_removed')
+    background_method = StateField('background_method')
+    mask_history = StateField('mask_history')  # Tuple of mask dicts (mask, blur_type, intensity)
+    median_blur_used = StateField('median_blur_used')
+    geometry_ops = StateField('geometry_ops')  # Crop and resize steps, replayed after the filters
+
     def __init__(self):
         super().__init__()
         # Values for window styling
@@ -26,20 +63,15 @@ class SnappicApp(tk.Tk):
         self.original = None
         self.processed = None
         
-        # Filter values
-        self.gaussian_value = 0
-        self.median_value = 0
-        self.darken_value = 0 
-        self.brighten_value = 0  
-        self.is_grayscale = False
-        self.is_blackwhite = False
-        self.bw_threshold = 127
-        self.bg_threshold = 240  
-        self.show_binary = False
+        # Filter values, background removal, selective areas and crop/resize steps
+        self.edit_state = EditState()
         
-        # Track background removal state
-        self.has_background_removed = False
-        self.background_method = None  
+        # Last render and the state it came from, so an unchanged state is free
+        self.last_render = None
+        
+        # GrabCut runs in the background, one pass at a time
+        self.grabcut_job = None
+        self.grabcut_preview = None
         
         # Track selective blurring state
         self.selective_blur_mode = False
@@ -49,13 +81,37 @@ class SnappicApp(tk.Tk):
         self.current_mask_type = "rectangle"
         self.selective_intensity = 50
         self.selective_blur_type = "gaussian"
-        self.mask_history = []  # List of (mask, blur_type, intensity)
         
-        # Track if median blur has been used for user feedback
-        self.median_blur_used = False  
+        # Filters run on row bands across all cores
+        self.executor = BandExecutor()
+        
+        # Independent render stages (background mask, gray plane) overlap here;
+        # separate from the band pool, whose tasks the stages wait on
+        self.graph_pool = ThreadPoolExecutor(max_workers=2)
+        
+        # A render predicted to need more RAM than this runs tiled
+        self.render_budget = default_render_budget()
+        # Debug: trace every allocation of a render (tracemalloc, slow), not
+        # just its arrays
+        self.trace_memory = tk.BooleanVar(value=False)
+        
+        # Stage results and gray planes of recent renders
+        self.render_cache = RenderCache()
         
-        # Keep uncropped original (to revert back to uncropped version)
-        self.original_backup = None  
+        # Decoded pixels of recently opened large files, reopened memory-mapped
+        self.pixel_cache = PixelCache()
+        
+        # Undo/redo log of every edit with cached renders
+        self.edit_history = EditHistory()
+        
+        # Open images share one RAM budget, inactive ones spill to disk
+        self.session = Session()
+        self.document = None
+        self.thumb_images = []
+
+        # Contact sheet of one value at several settings
+        self.sweep_window = None
+        self.sweep_cells = []
 
         # Cropping features
         self.crop_mode = False
@@ -65,6 +121,7 @@ class SnappicApp(tk.Tk):
         
         self.create_layout()
         self.bind_mouse_events()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def bind_mouse_events(self):
         # Bind mouse events from user for selective blur drawing and cropping features
@@ -78,6 +135,10 @@ class SnappicApp(tk.Tk):
             self.image_label.bind("<Control-Button-1>", self.start_crop)  # Ctrl+Click for crop
             self.image_label.bind("<Control-B1-Motion>", self.draw_crop)
             self.image_label.bind("<Control-ButtonRelease-1>", self.finish_crop)
+        
+        # Undo/redo shortcuts
+        self.bind("<Control-z>", lambda e: self.undo_edit())
+        self.bind("<Control-y>", lambda e: self.redo_edit())
             
 # ---- CREATE LAYOUT INTERFACE -----
     def create_layout(self):
@@ -98,6 +159,22 @@ class SnappicApp(tk.Tk):
                 fg="white", bg="#1e1e1e").pack()
         self.history = tk.Listbox(history_frame, width=25, bg="#2a2a2a", fg="white")
         self.history.pack(fill="both", expand=True, pady=5)
+        # Stage timings of the last render and its critical path
+        self.timing_label = tk.Label(history_frame, text="", fg="#888888", bg="#1e1e1e",
+                                     font=("Arial", 8), wraplength=180, justify="left")
+        self.timing_label.pack(fill="x")
+        # Peak memory of the last render per stage, and how the budget ran it
+        self.memory_label = tk.Label(history_frame, text="", fg="#888888", bg="#1e1e1e",
+                                     font=("Arial", 8), wraplength=180, justify="left")
+        self.memory_label.pack(fill="x")
+        
+        # Open images as thumbnails, click one to switch to it
+        tk.Label(history_frame, text="IMAGES", font=("Arial", 12, "bold"),
+                fg="white", bg="#1e1e1e").pack()
+        self.session_label = tk.Label(history_frame, text="", fg="#888888", bg="#1e1e1e")
+        self.session_label.pack()
+        self.session_frame = tk.Frame(history_frame, bg="#1e1e1e")
+        self.session_frame.pack(fill="x", pady=5)
 
         # Panel Image Display
         image_frame = tk.Frame(main_container, bg="#1e1e1e")
@@ -137,8 +214,14 @@ class SnappicApp(tk.Tk):
                 width=10, height=1).pack(side="left", padx=5)
         tk.Button(button_container, text="SAVE", command=self.save,
                 width=10, height=1).pack(side="left", padx=5)
+        tk.Button(button_container, text="CLOSE", command=self.close_document,
+                width=10, height=1).pack(side="left", padx=5)
         tk.Button(button_container, text="RESET ALL", command=self.reset_filters,
                 width=10, height=1).pack(side="left", padx=5)
+        tk.Button(button_container, text="UNDO", command=self.undo_edit,
+                width=10, height=1).pack(side="left", padx=5)
+        tk.Button(button_container, text="REDO", command=self.redo_edit,
+                width=10, height=1).pack(side="left", padx=5)
 
         # Menu bar
         menubar = tk.Menu(self)
@@ -148,8 +231,19 @@ class SnappicApp(tk.Tk):
         menubar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="Open", command=self.load)
         file_menu.add_command(label="Save", command=self.save)
+        file_menu.add_command(label="Close Image", command=self.close_document)
         file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=self.quit)
+        file_menu.add_command(label="Exit", command=self.on_close)
+        
+        edit_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Edit", menu=edit_menu)
+        edit_menu.add_command(label="Undo", accelerator="Ctrl+Z", command=self.undo_edit)
+        edit_menu.add_command(label="Redo", accelerator="Ctrl+Y", command=self.redo_edit)
+        edit_menu.add_separator()
+        edit_menu.add_command(label="Variant Sweep...", command=self.open_sweep)
+        edit_menu.add_command(label="Render Memory Budget...", command=self.set_render_budget)
+        edit_menu.add_checkbutton(label="Trace Render Memory", variable=self.trace_memory,
+                                  command=self.toggle_memory_trace)
         
 
 # ---- CREATE BLURRING TAB -----
@@ -228,9 +322,14 @@ class SnappicApp(tk.Tk):
                     value="freeform", fg="white", bg="#1e1e1e",
                     selectcolor="#2a2a2a",
                     command=lambda: setattr(self, 'current_mask_type', 'freeform')).pack(side="left", padx=5)
+        tk.Radiobutton(shape_frame, text="Gradient", variable=self.mask_shape_var,
+                    value="gradient", fg="white", bg="#1e1e1e",
+                    selectcolor="#2a2a2a",
+                    command=lambda: setattr(self, 'current_mask_type', 'gradient')).pack(side="left", padx=5)
         
-        # Blur type selection: Gaussian Blur and Median Blur
+        # Blur type selection: Gaussian Blur, Median Blur and Lens Blur
         # Note that Median Blurring is computationally expensive, so only one-time is allowed
+        # Lens areas add up to one depth map, the blur radius follows the mask value
         type_frame = tk.Frame(selective_frame, bg="#1e1e1e")
         type_frame.pack(pady=5)
         
@@ -245,6 +344,10 @@ class SnappicApp(tk.Tk):
                     value="median", fg="white", bg="#1e1e1e",
                     selectcolor="#2a2a2a",
                     command=lambda: setattr(self, 'selective_blur_type', 'median')).pack(side="left", padx=5)
+        tk.Radiobutton(type_frame, text="Lens", variable=self.selective_blur_var,
+                    value="lens", fg="white", bg="#1e1e1e",
+                    selectcolor="#2a2a2a",
+                    command=lambda: setattr(self, 'selective_blur_type', 'lens')).pack(side="left", padx=5)
         
         # Intensity slider
         tk.Label(selective_frame, text="Intensity:", fg="white", bg="#1e1e1e").pack(pady=(5,0))
@@ -380,6 +483,22 @@ class SnappicApp(tk.Tk):
                 width=20, height=2,
                 bg="#2a2a2a", fg="white").pack(pady=5)
         
+        # GrabCut progress, stop it or keep the mask it has so far
+        self.grabcut_status = tk.Label(tab, text="", fg="#888888", bg="#1e1e1e",
+                                       font=("Arial", 8))
+        self.grabcut_status.pack(pady=2)
+        self.grabcut_progress = ttk.Progressbar(tab, length=200, mode="determinate")
+        self.grabcut_progress.pack(pady=2)
+        
+        job_frame = tk.Frame(tab, bg="#1e1e1e")
+        job_frame.pack(pady=5)
+        self.grabcut_cancel_btn = tk.Button(job_frame, text="CANCEL", command=self.cancel_grabcut,
+                                            width=9, bg="#2a2a2a", fg="white", state="disabled")
+        self.grabcut_cancel_btn.pack(side="left", padx=3)
+        self.grabcut_accept_btn = tk.Button(job_frame, text="ACCEPT", command=self.accept_grabcut,
+                                            width=9, bg="#2a2a2a", fg="white", state="disabled")
+        self.grabcut_accept_btn.pack(side="left", padx=3)
+        
         tk.Frame(tab, height=2, bg="#333333").pack(fill="x", padx=20, pady=15)
         
         # Threshold
@@ -414,9 +533,8 @@ class SnappicApp(tk.Tk):
 
     def reset_crop_only(self):
         # Reset crop without affecting other filters.
-        print("DEBUG: reset_crop_only called")
         if self.original is not None:
-            
+            self.geometry_ops = []
             self.apply_all_filters()
             
             # Turn off crop mode
@@ -431,7 +549,7 @@ class SnappicApp(tk.Tk):
             self.crop_end = None
             self.crop_rect = None
             
-            self.history.insert("end", "Crop reset")
+            self.log_edit("Crop reset")
         else:
             messagebox.showwarning("No Image", "No image to reset")
             
@@ -445,16 +563,133 @@ class SnappicApp(tk.Tk):
         path = filedialog.askopenfilename(filetypes=filetypes)
         if path:
             try:
-                self.original = load_image(path)
+                image = load_image(path, self.pixel_cache)
+                if image is None:
+                    raise ValueError("Unsupported or unreadable file")
+                
+                # The current image stays open in the session
+                self.cancel_grabcut()
+                self.store_document()
+                self.document = self.session.add(path, image)
+                self.edit_history = self.document.edit_history
+                self.original = image
+                self.render_cache.clear()
                 self.processed = self.original.copy()
-                self.original_backup = self.original.copy()
                 self.reset_filters()
                 self.update_image(self.processed)
                 self.placeholder_label.pack_forget()
                 self.history.insert("end", f"Loaded: {path.split('/')[-1]}")
+                self.edit_history.clear(f"Loaded: {path.split('/')[-1]}",
+                                        self.snapshot_state(), self.processed)
+                self.session.activate(self.document)
+                self.refresh_session_strip()
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to load image: {str(e)}")
 
+# ---- KEEP SEVERAL IMAGES OPEN AND SWITCH BETWEEN THEM -----
+    def store_document(self):
+        # Park the edit values, image and history lines of the current image
+        doc = self.document
+        if doc is None:
+            return
+        doc.state = self.snapshot_state()
+        doc.original = self.original
+        doc.processed = self.processed
+        doc.log_lines = list(self.history.get(0, tk.END))
+        doc.update_thumbnail()
+
+    def switch_document(self, doc):
+        if doc is self.document:
+            return
+        self.store_document()
+        self.exit_edit_modes()
+        
+        # Drop every reference to the old image's pixels first, or spilling
+        # it frees nothing
+        self.original = None
+        self.processed = None
+        self.last_render = None
+        self.render_cache.clear()
+        
+        # Spilled pixels are memory-mapped and page back in as they are read
+        self.document = doc
+        self.session.activate(doc)
+        self.original = doc.original
+        self.edit_history = doc.edit_history
+        
+        self.history.delete(0, tk.END)
+        for line in doc.log_lines:
+            self.history.insert("end", line)
+        self.placeholder_label.pack_forget()
+        self.restore_state(doc.state, doc.processed)
+        self.refresh_session_strip()
+
+    def close_document(self):
+        doc = self.document
+        if doc is None:
+            messagebox.showwarning("No Image", "No image to close")
+            return
+        self.cancel_grabcut()
+        self.document = None
+        self.last_render = None
+        self.render_cache.clear()
+        self.session.close(doc)
+        
+        if self.session.documents:
+            self.switch_document(self.session.recent[-1])
+            return
+        
+        # Last image closed, back to the empty editor
+        self.original = None
+        self.processed = None
+        self.edit_history = EditHistory()
+        self.render_cache.clear()
+        self.reset_filters()
+        self.image_label.config(image="")
+        self.image_label.image = None
+        self.refresh_session_strip()
+
+    def on_close(self):
+        # Remove the spill files of every open image
+        self.cancel_grabcut()
+        self.session.shutdown()
+        self.graph_pool.shutdown(wait=False)
+        self.destroy()
+
+    def exit_edit_modes(self):
+        self.cancel_grabcut()
+        self.selective_blur_mode = False
+        self.selective_toggle_btn.config(text="ENABLE SELECTIVE MODE", bg="#2a2a2a", fg="white")
+        self.crop_mode = False
+        self.crop_toggle_btn.config(text="ENABLE CROP", bg="#2a2a2a", fg="white")
+        self.current_mask = None
+        self.mask_start = None
+        self.mask_points = []
+        self.crop_start = None
+        self.crop_end = None
+        self.crop_rect = None
+
+    def refresh_session_strip(self):
+        for child in self.session_frame.winfo_children():
+            child.destroy()
+        self.thumb_images = []
+        
+        for doc in self.session.documents:
+            if doc is self.document and self.processed is not None:
+                doc.processed = self.processed
+                doc.update_thumbnail()
+            thumb = cv_to_tk(doc.thumbnail)
+            self.thumb_images.append(thumb)
+            active = doc is self.document
+            tk.Button(self.session_frame, image=thumb, text=doc.name[:18], compound="top",
+                      bg="#4a4a4a" if active else "#2a2a2a", fg="white",
+                      command=lambda d=doc: self.switch_document(d)).pack(fill="x", pady=2)
+        
+        used = self.session.resident_bytes / 2**20
+        budget = self.session.memory_budget / 2**20
+        self.session_label.config(text=f"RAM {used:.0f} / {budget:.0f} MB"
+                                  if self.session.documents else "")
+
 # ---- CREATE SAVE TAB -----
     def save(self):
         if self.processed is not None:
@@ -478,6 +713,7 @@ class SnappicApp(tk.Tk):
     def update_image(self, img):
         if img is not None:
             self.update_idletasks()
+            self.display_scale = 1.0
             
             # Image Display Area
             frame_width = self.image_label.winfo_width()
@@ -497,60 +733,182 @@ class SnappicApp(tk.Tk):
                     new_width = int(img_width * scale)
                     new_height = int(img_height * scale)
                     img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
+                    self.display_scale = scale
             
             # Convert to Tkinter PhotoImage
             self.tk_img = cv_to_tk(img)
             self.image_label.config(image=self.tk_img)
             self.image_label.image = self.tk_img
 
+# ---- REPAINT ONLY A CHANGED BOX OF THE DISPLAYED IMAGE -----
+    def update_image_region(self, img, box):
+        photo = getattr(self, 'tk_img', None)
+        if photo is None:
+            return self.update_image(img)
+        
+        # Box in display pixels, rounded outward
+        scale = self.display_scale
+        x1, y1, x2, y2 = box
+        dx1, dy1 = int(x1 * scale), int(y1 * scale)
+        dx2 = min(photo.width(), int(np.ceil(x2 * scale)))
+        dy2 = min(photo.height(), int(np.ceil(y2 * scale)))
+        if dx2 <= dx1 or dy2 <= dy1:
+            return
+        
+        # Source pixels behind those display pixels
+        sx1, sy1 = int(dx1 / scale), int(dy1 / scale)
+        sx2 = min(img.shape[1], int(np.ceil(dx2 / scale)))
+        sy2 = min(img.shape[0], int(np.ceil(dy2 / scale)))
+        patch = img[sy1:sy2, sx1:sx2]
+        if scale != 1.0:
+            patch = cv2.resize(patch, (dx2 - dx1, dy2 - dy1), interpolation=cv2.INTER_AREA)
+        
+        # Tk copies the patch into the shown photo, the rest is untouched
+        self.tk_patch = cv_to_tk(patch)
+        self.tk.call(str(photo), "copy", str(self.tk_patch), "-to", dx1, dy1)
+        
+        # The label may still show the drawing preview
+        self.image_label.config(image=photo)
+        self.image_label.image = photo
+
+# ---- RE-RENDER ONLY WHAT A SELECTIVE MASK CHANGE TOUCHED -----
+    def apply_filters_since(self, previous_state):
+        state = self.snapshot_state()
+        changed = previous_state.diff(state)
+        if self.processed is not None and not changed:
+            # Nothing to redo, but drop the drawing preview
+            return self.update_image(self.processed)
+        
+        crops, rest = split_geometry(state.geometry_ops)
+        rect = None
+        if self.processed is not None and not rest and changed == ("blur",):
+            rect = dirty_rect(previous_state.recipe(), state.recipe(), self.original.shape)
+        if rect is None:
+            return self.apply_all_filters()
+        
+        roi = crop_rect(crops, self.original.shape) if crops else None
+        self.processed, box = render_region(self.original, state.recipe(),
+                                            self.processed, rect, roi, self.executor)
+        if box is not None:
+            self.update_image_region(self.processed, box)
+        else:
+            # Nothing changed, but drop the drawing preview
+            self.update_image(self.processed)
+
+# ---- SNAPSHOT OF ALL EDIT VALUES (ONE UNDO STEP) -----
+    def snapshot_state(self):
+        # The state is immutable, so the current one is its own snapshot
+        return self.edit_state
+
+# ---- COLLECT THE CURRENT FILTER VALUES AS A RECIPE -----
+    def current_recipe(self):
+        return self.edit_state.recipe()
+
 # ---- COMBINE ALL FILTERS METHOD -----
     def apply_all_filters(self):
         if self.original is None:
             return
         
-        # Start with base image, NOT the one with background removed
-        if self.has_background_removed:
-            temp = self.original.copy()
+        # Always start from the base image, NOT the one with background removed
+        self.processed = self.render_state(self.snapshot_state())
+        self.update_image(self.processed)
+    
+    def render_state(self, state):
+        # An equal state on the same image renders the same pixels
+        last = self.last_render
+        if last is not None and last[0] is self.original and last[1] == state:
+            return last[2]
+        
+        # Leading crops are the region the filters run on, so a small crop of a
+        # big photo only filters the crop. Resizes (and crops after them) replay after.
+        crops, rest = split_geometry(state.geometry_ops)
+        roi = crop_rect(crops, self.original.shape) if crops else None
+        stats = GraphStats()
+        with MemoryStats(trace=self.trace_memory.get()) as memory:
+            result = render(self.original, state.recipe(), executor=self.executor,
+                            cache=self.render_cache, roi=roi, pool=self.graph_pool,
+                            stats=stats, memory=memory, budget=self.render_budget)
+        result = apply_geometry(result, rest)
+        self.last_render = (self.original, state, result)
+        self.timing_label.config(text=stats.summary() if stats.times else "")
+        self.memory_label.config(text=f"{memory.summary()}, budget "
+                                 f"{self.render_budget / 2**20:.0f} MB")
+        return result
+    
+    def set_render_budget(self):
+        # Renders predicted to go over it run in bands (see plan_memory)
+        mb = simpledialog.askinteger("Render Memory Budget", "RAM for one render (MB):",
+                                     initialvalue=self.render_budget // 2**20,
+                                     minvalue=64, parent=self)
+        if mb is None:
+            return
+        self.render_budget = mb * 2**20
+        self.last_render = None
+        self.history.insert("end", f"Render budget: {mb} MB")
+        self.apply_all_filters()
+    
+    def toggle_memory_trace(self):
+        # Re-render so the label shows the traced peaks right away
+        self.last_render = None
+        self.apply_all_filters()
+    
+    def replay_geometry(self, image, previous_state, state):
+        # Only crop/resize steps separate these two states
+        new_ops = state.geometry_ops[len(previous_state.geometry_ops):]
+        return apply_geometry(image, new_ops)
+
+# ---- RECORD AN EDIT IN THE HISTORY PANEL AND THE UNDO LOG -----
+    def log_edit(self, label, kind="param", merge_key=None):
+        self.history.insert("end", label)
+        if self.original is not None:
+            self.edit_history.push(label, self.snapshot_state(), self.processed,
+                                   kind=kind, merge_key=merge_key)
+
+# ---- UNDO/REDO ANY EDIT -----
+    def undo_edit(self):
+        if not self.edit_history.can_undo():
+            return
+        label = self.edit_history.current.label
+        entry, image = self.edit_history.undo(self.render_state, self.replay_geometry)
+        self.restore_state(entry.state, image)
+        self.history.insert("end", f"Undo: {label}")
+
+    def redo_edit(self):
+        if not self.edit_history.can_redo():
+            return
+        entry, image = self.edit_history.redo(self.render_state, self.replay_geometry)
+        self.restore_state(entry.state, image)
+        self.history.insert("end", f"Redo: {entry.label}")
+
+    def restore_state(self, state, image):
+        self.edit_state = state
+        self.processed = image
+        self.sync_controls()
+        self.update_image(self.processed)
+
+# ---- MATCH SLIDERS AND BUTTONS TO THE CURRENT VALUES -----
+    def sync_controls(self):
+        # Slider callbacks see an unchanged value and do nothing
+        self.gaussian_slider.set(self.gaussian_value)
+        self.median_slider.set(self.median_value)
+        self.darken_slider.set(self.darken_value)
+        self.brighten_slider.set(self.brighten_value)
+        self.bg_threshold_slider.set(self.bg_threshold)
+        
+        # A disabled Scale ignores set(), so enable it first
+        self.bw_slider.config(state="normal")
+        self.bw_slider.set(self.bw_threshold)
+        self.bw_slider.config(state="normal" if self.is_blackwhite else "disabled")
+        
+        self.grayscale_btn.config(bg="#4a4a4a" if self.is_grayscale else "#2a2a2a", fg="white")
+        if self.is_blackwhite:
+            self.bw_toggle_btn.config(text="BLACK & WHITE ✓", bg="#4a4a4a", fg="white")
         else:
-            temp = self.original.copy()
-        
-        # Apply global blur first
-        if self.gaussian_value > 0:
-            temp = gaussian_blur(temp, self.gaussian_value)
-        
-        if self.median_value > 0:
-            temp = median_blur(temp, self.median_value)
-        
-        # Apply selective blur using optimized version
-        temp = self.apply_selective_blur(temp)
-        
-        # Apply other filters
-        if self.darken_value > 0:
-            temp = adjust_darken(temp, self.darken_value)
-            
-        if self.brighten_value > 0:
-            temp = adjust_brighten(temp, self.brighten_value)
-        
-        if self.is_grayscale:
-            temp = grayscale(temp)
-            
-            if self.is_blackwhite:
-                temp = black_white(temp, self.bw_threshold)
-        
-        # Background removal
-        if self.has_background_removed:
-            if self.background_method == "grabcut":
-                temp = remove_background_grabcut(temp)
-            elif self.background_method == "simple":
-                temp = remove_background_simple(temp, self.bg_threshold)
-            elif self.background_method == "edge":
-                temp = remove_background_edge(temp)
-        
+            self.bw_toggle_btn.config(text="BLACK & WHITE", bg="#2a2a2a", fg="white")
         if self.show_binary:
-            temp = show_binary_mask(temp)
-        
-        self.processed = temp
-        self.update_image(self.processed)
+            self.binary_toggle_btn.config(text="HIDE BINARY MASK", bg="#4a4a4a", fg="white")
+        else:
+            self.binary_toggle_btn.config(text="SHOW BINARY MASK", bg="#2a2a2a", fg="white")
     
 # ---- CREATE A PREVIEW OF MASK BEING DRAWN ----
     def create_mask_preview(self, start, end):
@@ -654,6 +1012,15 @@ class SnappicApp(tk.Tk):
                 pts = np.array(img_points, dtype=np.int32)
                 cv2.fillPoly(mask, [pts], 255)
         
+        elif self.current_mask_type == "gradient":
+            # Linear ramp from 0 at the start point to full at the end point
+            dx, dy = x2 - x1, y2 - y1
+            length2 = max(dx * dx + dy * dy, 1)
+            ramp = ((np.arange(img_w, dtype=np.float32)[None, :] - x1) * (dx / length2)
+                    + (np.arange(img_h, dtype=np.float32)[:, None] - y1) * (dy / length2))
+            mask = (np.clip(ramp, 0, 1) * 255).astype(np.uint8)
+            return mask
+        
         # Apply feathering for smooth edges
         if np.any(mask > 0):
             mask = cv2.GaussianBlur(mask, (21, 21), 10)
@@ -725,195 +1092,41 @@ class SnappicApp(tk.Tk):
                     else:
                         self.median_blur_used = True  # Set the flag
                 
-                # Add to history
-                self.mask_history.append({
-                    'mask': final_mask.copy(),
+                previous_state = self.snapshot_state()
+                
+                # Masks are drawn on the cropped/resized view but stored in
+                # the coordinates of the original image
+                self.mask_history += ({
+                    'mask': unapply_geometry(final_mask, self.geometry_ops, self.original.shape),
                     'blur_type': self.selective_blur_type,
                     'intensity': self.selective_intensity
-                })
+                },)
                 
-                # Apply filters to update display with actual blur
-                self.apply_all_filters()
-                self.history.insert("end", 
+                # Only the new area (plus blur reach) is re-rendered
+                self.apply_filters_since(previous_state)
+                self.log_edit(
                     f"Added {self.current_mask_type} blur area ({self.selective_blur_type}, intensity: {self.selective_intensity})")
             
             # Reset for next drawing
             self.mask_start = None
             self.mask_points = []
 
-# ---- APPLYING SELECTIVE BLUR USING ROI EXTRACTION ----
-    def apply_selective_blur(self, image):
-    
-        if not self.mask_history:
-            return image.copy()
-        
-        result = image.copy()
-        
-        # Separate masks by blur type 
-        gaussian_masks = []
-        median_masks = []
-        
-        for mask_data in self.mask_history:
-            if mask_data['blur_type'] == 'gaussian':
-                gaussian_masks.append(mask_data)
-            else:
-                median_masks.append(mask_data)
-        
-        # Process Gaussian blurs
-        if gaussian_masks:
-            result = self._apply_gaussian_masks_roi(result, gaussian_masks)
-        
-        # Process Median blurs 
-        if median_masks:
-            result = self._apply_median_masks_roi(result, median_masks)
-        
-        return result
-
-# ---- APPLY GAUSSIAN BLUR FROM MASKING (TO ROI AREA ONLY) ----
-    def _apply_gaussian_masks_roi(self, image, masks):
-        result = image.copy()
-        
-        for mask_data in masks:
-            mask = mask_data['mask']
-            intensity = mask_data['intensity']
-            
-            # Calculate kernel size
-            kernel_size = max(1, (intensity * 51) // 100)
-            if kernel_size % 2 == 0:
-                kernel_size += 1
-            
-            # Skip if mask is empty
-            if not np.any(mask > 0):
-                continue
-            
-            # Get ROI bounding box 
-            rows = np.any(mask > 0, axis=1)
-            cols = np.any(mask > 0, axis=0)
-            
-            y_indices = np.where(rows)[0]
-            x_indices = np.where(cols)[0]
-            
-            if len(y_indices) == 0 or len(x_indices) == 0:
-                continue
-                
-            y1, y2 = y_indices[0], y_indices[-1]
-            x1, x2 = x_indices[0], x_indices[-1]
-            
-            # Extract only the ROI
-            roi_height = y2 - y1 + 1
-            roi_width = x2 - x1 + 1
-            
-            # Skip very small ROIs (no blur effect)
-            if roi_height < 3 or roi_width < 3:
-                continue
-            
-            roi = result[y1:y2+1, x1:x2+1].copy()
-            mask_roi = mask[y1:y2+1, x1:x2+1]
-            
-            # Blur only the ROI
-            blurred_roi = cv2.GaussianBlur(roi, (kernel_size, kernel_size), 0)
-            
-            # Apply mask within ROI only
-            mask_normalized = mask_roi.astype(np.float32) / 255.0
-            
-            if len(roi.shape) == 3:  # Color image
-                mask_3d = np.stack([mask_normalized] * 3, axis=2)
-                blended_roi = roi * (1 - mask_3d) + blurred_roi * mask_3d
-            else:  # Grayscale
-                blended_roi = roi * (1 - mask_normalized) + blurred_roi * mask_normalized
-            
-            # Paste back only the blended ROI
-            result[y1:y2+1, x1:x2+1] = blended_roi
-        
-        return result
-    
-# ---- APPLY MEDIAAN BLUR FROM MASKING ----
-    def _apply_median_masks_roi(self, image, masks):
-
-        result = image.copy()
-        
-        # Group by kernel size to potentially cache results
-        masks_by_kernel = {}
-        for mask_data in masks:
-            intensity = mask_data['intensity']
-            kernel_size = max(1, (intensity * 51) // 100)
-            if kernel_size % 2 == 0:
-                kernel_size += 1
-            
-            if kernel_size not in masks_by_kernel:
-                masks_by_kernel[kernel_size] = []
-            masks_by_kernel[kernel_size].append(mask_data)
-        
-        # Process each kernel size separately
-        for kernel_size, mask_list in masks_by_kernel.items():
-            # Warn for large median kernels
-            if kernel_size > 15 and len(mask_list) > 1:
-            # Suppposed to show a warning message here
-                pass
-            
-            for mask_data in mask_list:
-                mask = mask_data['mask']
-                
-                # Skip if mask is empty
-                if not np.any(mask > 0):
-                    continue
-                
-                # Get ROI bounding box
-                rows = np.any(mask > 0, axis=1)
-                cols = np.any(mask > 0, axis=0)
-                
-                y_indices = np.where(rows)[0]
-                x_indices = np.where(cols)[0]
-                
-                if len(y_indices) == 0 or len(x_indices) == 0:
-                    continue
-                    
-                y1, y2 = y_indices[0], y_indices[-1]
-                x1, x2 = x_indices[0], x_indices[-1]
-                
-                # Calculate ROI size
-                roi_height = y2 - y1 + 1
-                roi_width = x2 - x1 + 1
-                
-                # Skip very small ROIs
-                if roi_height < kernel_size or roi_width < kernel_size:
-                    continue
-                
-                # Extract ROI
-                roi = result[y1:y2+1, x1:x2+1].copy()
-                mask_roi = mask[y1:y2+1, x1:x2+1]
-                
-                # Apply median blur to ROI
-                blurred_roi = cv2.medianBlur(roi, kernel_size)
-                
-                # Apply mask within ROI
-                mask_normalized = mask_roi.astype(np.float32) / 255.0
-                
-                if len(roi.shape) == 3:
-                    mask_3d = np.stack([mask_normalized] * 3, axis=2)
-                    blended_roi = roi * (1 - mask_3d) + blurred_roi * mask_3d
-                else:
-                    blended_roi = roi * (1 - mask_normalized) + blurred_roi * mask_normalized
-                
-                # Paste back
-                result[y1:y2+1, x1:x2+1] = blended_roi
-        
-        return result
-
 # ---- CLEAR SELECTIVE BLUR AREA ----
     def clear_selective_areas(self):
+        previous_state = self.snapshot_state()
         self.mask_history = []
         self.current_mask = None
-        self.apply_all_filters()
-        self.history.insert("end", "Cleared all selective blur areas")
+        self.apply_filters_since(previous_state)
+        self.log_edit("Cleared all selective blur areas")
 
 # ---- REMOVE THE LATEST SELECTIVE BLURRED AREA ----
     def undo_last_mask(self):
         """Remove the last selective blur area."""
         if self.mask_history:
-            self.mask_history.pop()
-            self.apply_all_filters()
-            self.history.insert("end", "Removed last selective blur area")
+            previous_state = self.snapshot_state()
+            self.mask_history = self.mask_history[:-1]
+            self.apply_filters_since(previous_state)
+            self.log_edit("Removed last selective blur area")
 
 # ---- STYLING FOR SELECTIVE MODE AND WARNING MESSAGE FOR SELECTIVE MEDIAN BLURRING ----
 # --- TOGGLE FOR SELECTIVE MODE ON/OFF
@@ -1092,11 +1305,9 @@ class SnappicApp(tk.Tk):
                                     "Crop rectangle is too small or invalid")
                 return
             
-            # Perform crop on PROCESSED image only
-            cropped = self.processed[y1:y2, x1:x2]
-            
-            # Update processed image ONLY
-            self.processed = cropped
+            # Crop the current result and remember the step for later renders
+            self.geometry_ops += ({'op': 'crop', 'rect': (x1, y1, x2, y2)},)
+            self.processed = apply_geometry(self.processed, self.geometry_ops[-1:])
              
             # Update display
             self.update_image(self.processed)
@@ -1104,7 +1315,7 @@ class SnappicApp(tk.Tk):
             # Update history
             width = x2 - x1
             height = y2 - y1
-            self.history.insert("end", f"Cropped to: {width}x{height} pixels")
+            self.log_edit(f"Cropped to: {width}x{height} pixels", kind="geometry")
             
             # Reset crop mode
             self.crop_mode = False
@@ -1138,13 +1349,9 @@ class SnappicApp(tk.Tk):
                 y2 = y1 + new_height
                 x1, x2 = 0, w
             
-            # Perform crop on PROCESSED image only
-            cropped = self.processed[y1:y2, x1:x2]
-            
-            # Update processed image ONLY
-            self.processed = cropped
-            
-            # DO NOT update original
+            # Crop the current result and remember the step for later renders
+            self.geometry_ops += ({'op': 'crop', 'rect': (x1, y1, x2, y2)},)
+            self.processed = apply_geometry(self.processed, self.geometry_ops[-1:])
             
             # Update display
             self.update_image(self.processed)
@@ -1158,24 +1365,26 @@ class SnappicApp(tk.Tk):
                 16/9: "16:9 (Wide)",
                 3/2: "3:2 (35mm Film)"
             }.get(aspect_ratio, f"{aspect_ratio:.2f}:1")
-            self.history.insert("end", f"Aspect ratio crop: {ratio_name} ({new_width}x{new_height})")
+            self.log_edit(f"Aspect ratio crop: {ratio_name} ({new_width}x{new_height})", kind="geometry")
             
         except Exception as e:
             messagebox.showerror("Crop Error", f"Failed to crop image: {str(e)}")  
             
 # ---- DEFINE METHOD TO APPLY GAUSSIAN BLUR -----
     def apply_gaussian(self, v):
+        if int(v) == self.gaussian_value:
+            return
         self.gaussian_value = int(v)
         self.apply_all_filters()
-        if int(v) > 0:
-            self.history.insert("end", f"Gaussian Blur: {v}")
+        self.log_edit(f"Gaussian Blur: {v}", merge_key="gaussian_value")
 
 # ---- DEFINE METHOD TO APPLY MEDIAN BLUR -----
     def apply_median(self, v):
+        if int(v) == self.median_value:
+            return
         self.median_value = int(v)
         self.apply_all_filters()
-        if int(v) > 0:
-            self.history.insert("end", f"Median Blur: {v}")
+        self.log_edit(f"Median Blur: {v}", merge_key="median_value")
 
 # ---- DEFINE METHOD TO APPLY GRAYSCALE FILTER -----
     def apply_gray(self):
@@ -1194,7 +1403,7 @@ class SnappicApp(tk.Tk):
         
         self.apply_all_filters()
         status = "ON" if self.is_grayscale else "OFF"
-        self.history.insert("end", f"Grayscale: {status}")
+        self.log_edit(f"Grayscale: {status}")
 
 # ---- DEFINE METHOD TO ENABLE BUTTON FOR BLACK AND WHITE FILTER -----
     def toggle_blackwhite(self):
@@ -1214,51 +1423,152 @@ class SnappicApp(tk.Tk):
             
         self.apply_all_filters()
         status = "ON" if self.is_blackwhite else "OFF"
-        self.history.insert("end", f"Black & White: {status}")
+        self.log_edit(f"Black & White: {status}")
 
 # ---- DEFINE METHOD TO APPLY BLACK AND WHITE FILTER -----
     def apply_bw(self, v):
+        if int(v) == self.bw_threshold:
+            return
         self.bw_threshold = int(v)
         self.apply_all_filters()
-        self.history.insert("end", f"B&W Threshold: {v}")
+        self.log_edit(f"B&W Threshold: {v}", merge_key="bw_threshold")
 
 # ---- DEFINE METHOD TO APPLY DARKENING FILTER -----
     def apply_darken(self, v):
+        if int(v) == self.darken_value:
+            return
         self.darken_value = int(v)
         self.apply_all_filters()
-        if int(v) > 0:
-            self.history.insert("end", f"Darken: {v}")
+        self.log_edit(f"Darken: {v}", merge_key="darken_value")
 
 # ---- DEFINE METHOD TO APPLY BRIGHTENING FILTER -----
     def apply_brighten(self, v):
+        if int(v) == self.brighten_value:
+            return
         self.brighten_value = int(v)
         self.apply_all_filters()
-        if int(v) > 0:
-            self.history.insert("end", f"Brighten: {v}")
+        self.log_edit(f"Brighten: {v}", merge_key="brighten_value")
 
 # ---- DEFINE METHOD TO APPLY SEGMENTATION - BACKGROUND REMOVAL -----
     def apply_background_removal(self, method):
-        if self.original is not None:
-            # Start from original for background removal
-            if method == "grabcut":
-                self.processed = remove_background_grabcut(self.original)
-                self.history.insert("end", "Background removed (GrabCut)")
-            elif method == "simple":
-                self.processed = remove_background_simple(self.original, self.bg_threshold)
-                self.history.insert("end", f"Background removed (Simple, threshold: {self.bg_threshold})")
-            elif method == "edge":
-                self.processed = remove_background_edge(self.original)
-                self.history.insert("end", "Background removed (Edge-based)")
-            
-            # Track background removal state
-            self.has_background_removed = True
-            self.background_method = method
-            
-            # Reset filter states since background removal replaces the image
-            self.reset_filter_states()
-            
+        if self.original is None:
+            return
+        if method == "grabcut":
+            # Seconds to minutes on a big photo, so it runs as a job
+            return self.start_grabcut()
+        self.cancel_grabcut()
+        
+        if method == "simple":
+            label = f"Background removed (Simple, threshold: {self.bg_threshold})"
+        else:
+            label = "Background removed (Edge-based)"
+        
+        # Track background removal state; the mask is made from the filtered image
+        self.has_background_removed = True
+        self.background_method = method
+        self.apply_all_filters()
+        self.log_edit(label)
+
+# ---- RUN GRABCUT AS A BACKGROUND JOB WITH A LIVE MASK PREVIEW -----
+    def grabcut_input(self):
+        # Same input render() would segment, so the finished mask can go
+        # straight into the render cache
+        state = self.snapshot_state().replace(has_background_removed=False)
+        crops, _ = split_geometry(state.geometry_ops)
+        roi = crop_rect(crops, self.original.shape) if crops else None
+        return segmentation_input(self.original, state.recipe(),
+                                  self.executor, self.render_cache, roi)
+
+    def start_grabcut(self):
+        self.cancel_grabcut()
+        base = self.grabcut_input()
+        
+        # Preview at display size, removed background dimmed
+        self.update_idletasks()
+        h, w = base.shape[:2]
+        scale = min(1.0, self.image_label.winfo_width() / w, self.image_label.winfo_height() / h)
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        small = cv2.resize(base, size, interpolation=cv2.INTER_AREA) if scale < 1 else base
+        self.grabcut_preview = (small, size)
+        
+        self.grabcut_job = GrabCutJob(base).start()
+        self.grabcut_progress.config(maximum=self.grabcut_job.iterations, value=0)
+        self.grabcut_status.config(text="GrabCut: initializing...")
+        self.grabcut_cancel_btn.config(state="normal")
+        self.grabcut_accept_btn.config(state="disabled")
+        self.after(50, self.poll_grabcut, self.grabcut_job)
+
+    def poll_grabcut(self, job):
+        if job is not self.grabcut_job:
+            return
+        while True:
+            try:
+                update = job.updates.get_nowait()
+            except queue.Empty:
+                break
+            kind = update[0]
+            if kind == "progress":
+                _, mask, i, changed = update
+                self.grabcut_progress.config(value=i)
+                note = "" if i == 1 else f", {changed:.2%} changed"
+                self.grabcut_status.config(text=f"GrabCut: pass {i}/{job.iterations}{note}")
+                self.grabcut_accept_btn.config(state="normal")
+                self.show_grabcut_preview(mask)
+            else:
+                self.finish_grabcut(job, update)
+                return
+        self.after(50, self.poll_grabcut, job)
+
+    def show_grabcut_preview(self, mask):
+        small, size = self.grabcut_preview
+        keep = cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST)
+        preview = small // 3
+        cv2.copyTo(small, keep, preview)
+        self.update_image(preview)
+
+    def finish_grabcut(self, job, update):
+        self.grabcut_job = None
+        self.grabcut_preview = None
+        self.grabcut_cancel_btn.config(state="disabled")
+        self.grabcut_accept_btn.config(state="disabled")
+        kind, payload = update
+        
+        if kind != "done":
+            self.grabcut_progress.config(value=0)
+            self.grabcut_status.config(text="GrabCut: cancelled" if kind == "cancelled"
+                                       else f"GrabCut failed: {payload}")
+            # Back to the image without the preview
             self.update_image(self.processed)
-            
+            return
+        
+        # Filters changed while it ran, the mask belongs to an older image
+        if self.grabcut_input() is not job.image:
+            return self.start_grabcut()
+        
+        # The next render finds the mask instead of running GrabCut again
+        self.render_cache.store(job.image, mask_key(job.image, "grabcut", self.bg_threshold),
+                                payload)
+        passes = int(self.grabcut_progress.cget("value"))
+        self.grabcut_status.config(text=f"GrabCut: done after {passes} passes")
+        self.has_background_removed = True
+        self.background_method = "grabcut"
+        self.apply_all_filters()
+        self.log_edit("Background removed (GrabCut)")
+
+    def cancel_grabcut(self):
+        job = self.grabcut_job
+        if job is None:
+            return
+        # The running pass finishes in the background and is thrown away
+        job.cancel()
+        self.finish_grabcut(job, ("cancelled", None))
+
+    def accept_grabcut(self):
+        if self.grabcut_job is not None:
+            self.grabcut_job.accept()
+            self.grabcut_status.config(text="GrabCut: finishing current pass...")
+            self.grabcut_accept_btn.config(state="disabled")
+
 # ---- DEFINE METHOD TO APPLY RESIZE FILTER -----
     def apply_resize(self):
         if self.processed is not None:  # Use processed image instead of original
@@ -1272,27 +1582,34 @@ class SnappicApp(tk.Tk):
                 if width or height:
                     # Resize the current processed image
                     self.processed = resize_image(self.processed, width, height)
+                    self.record_resize()
                     
                     # Update display with resized image
                     self.update_image(self.processed)
                     
                     if width and height:
-                        self.history.insert("end", f"Resized to: {width}x{height}")
+                        self.log_edit(f"Resized to: {width}x{height}", kind="geometry")
                     elif width:
-                        self.history.insert("end", f"Resized width to: {width}")
+                        self.log_edit(f"Resized width to: {width}", kind="geometry")
                     elif height:
-                        self.history.insert("end", f"Resized height to: {height}")
+                        self.log_edit(f"Resized height to: {height}", kind="geometry")
             except ValueError:
                 self.history.insert("end", "Invalid resize values")
                 messagebox.showerror("Invalid Input", "Please enter valid numbers for width and height")
         else:
             messagebox.showwarning("No Image", "Please load an image first")
 
+# ---- REMEMBER THE SIZE OF THE LAST RESIZE FOR LATER RENDERS -----
+    def record_resize(self):
+        h, w = self.processed.shape[:2]
+        self.geometry_ops += ({'op': 'resize', 'size': (w, h)},)
+
 # ---- DEFINE METHOD TO APPLY PRESET SIZES -----
     def apply_preset_size(self, preset):
         if self.processed is not None:  # Use processed image instead of original
             # Resize the current processed image
             self.processed = resize_to_preset(self.processed, preset)
+            self.record_resize()
             
             # Update display with resized image
             self.update_image(self.processed)
@@ -1306,13 +1623,20 @@ class SnappicApp(tk.Tk):
             }
             
             if preset in preset_names:
-                self.history.insert("end", f"Resized to: {preset_names[preset]}")
+                self.log_edit(f"Resized to: {preset_names[preset]}", kind="geometry")
         else:
             messagebox.showwarning("No Image", "Please load an image first")
 
 # ---- DEFINE METHOD TO UPDATE THE BACKGROUND THRESHOLD -----
     def update_bg_threshold(self, v):
+        if int(v) == self.bg_threshold:
+            return
         self.bg_threshold = int(v)
+        
+        # Live preview, only the threshold compare reruns on the cached gray plane
+        if self.has_background_removed and self.background_method == "simple":
+            self.apply_all_filters()
+            self.log_edit(f"Background threshold: {v}", merge_key="bg_threshold")
 
 # ---- DEFINE METHOD TO ENABLE BUTTON FOR BINARY MASK -----
     def toggle_binary_mask(self):
@@ -1324,7 +1648,7 @@ class SnappicApp(tk.Tk):
         
         self.apply_all_filters()
         status = "ON" if self.show_binary else "OFF"
-        self.history.insert("end", f"Binary Mask: {status}")
+        self.log_edit(f"Binary Mask: {status}")
 
 # ---- DEFINE METHOD TO CONFIGURE RESIZE TAB WITH CROPPING AND RESIZING FEATURES
     def resize_tab(self, notebook):
@@ -1438,12 +1762,20 @@ class SnappicApp(tk.Tk):
                             width=20, height=1,
                             bg="#2a2a2a", fg="white")
             btn.pack(pady=2)
+        
+        # Every preset (4K included) to files in one go
+        tk.Button(presets_frame, text="EXPORT ALL PRESETS...",
+                  command=self.export_all_presets,
+                  font=("Arial", 8, "bold"),
+                  width=20, height=1,
+                  bg="#2a2a2a", fg="white").pack(pady=(8, 2))
 
 # ---- DEFINE METHOD TO APPLY GRAYSCALE FILTER -----
     def apply_preset_size(self, preset):
         if self.processed is not None:  # Use processed image instead of original
             # Resize the current processed image
             self.processed = resize_to_preset(self.processed, preset)
+            self.record_resize()
             
             # Update display with resized image
             self.update_image(self.processed)
@@ -1457,10 +1789,92 @@ class SnappicApp(tk.Tk):
             }
             
             if preset in preset_names:
-                self.history.insert("end", f"Resized to: {preset_names[preset]}")
+                self.log_edit(f"Resized to: {preset_names[preset]}", kind="geometry")
         else:
             messagebox.showwarning("No Image", "Please load an image first")
 
+# ---- SAVE THE EDIT AT EVERY PRESET SIZE -----
+    def export_all_presets(self):
+        if self.original is None:
+            messagebox.showwarning("No Image", "Please load an image first")
+            return
+        folder = filedialog.askdirectory(title="Export all presets to")
+        if not folder:
+            return
+        
+        # The edit at full size, rendered once: crops stay, earlier resizes do not
+        state = self.snapshot_state()
+        crops, _ = split_geometry(state.geometry_ops)
+        image = self.render_state(state.replace(geometry_ops=crops))
+        stem = os.path.splitext(self.document.name)[0] if self.document else "snappic"
+        try:
+            paths = export_presets(image, folder, stem)
+            self.history.insert("end", f"Exported {len(paths)} preset sizes")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export presets: {str(e)}")
+
+# ---- RENDER ONE VALUE AT SEVERAL SETTINGS AS A CONTACT SHEET -----
+    def open_sweep(self):
+        if self.original is None:
+            messagebox.showwarning("No Image", "Please load an image first")
+            return
+        if self.sweep_window is not None and self.sweep_window.winfo_exists():
+            self.sweep_window.lift()
+            return self.render_sweep_sheet()
+        
+        win = tk.Toplevel(self, bg="#1e1e1e")
+        win.title("Variant Sweep")
+        self.sweep_window = win
+        
+        top = tk.Frame(win, bg="#1e1e1e")
+        top.pack(pady=5)
+        self.sweep_param = tk.StringVar(value="Brighten")
+        picker = ttk.Combobox(top, textvariable=self.sweep_param, values=list(SWEEP_PARAMS),
+                              state="readonly", width=16)
+        picker.pack(side="left", padx=5)
+        picker.bind("<<ComboboxSelected>>", lambda e: self.render_sweep_sheet())
+        tk.Button(top, text="REFRESH", command=self.render_sweep_sheet,
+                  width=10, bg="#2a2a2a", fg="white").pack(side="left", padx=5)
+        
+        tk.Label(win, text="Click a variant to apply it", fg="#888888", bg="#1e1e1e",
+                 font=("Arial", 8)).pack()
+        self.sweep_label = tk.Label(win, bg="#1e1e1e")
+        self.sweep_label.pack(padx=5, pady=5)
+        self.sweep_label.bind("<Button-1>", self.pick_sweep_variant)
+        self.render_sweep_sheet()
+
+    def render_sweep_sheet(self):
+        if self.original is None or self.sweep_window is None:
+            return
+        key, _, low, high = SWEEP_PARAMS[self.sweep_param.get()]
+        values = [int(v) for v in np.linspace(low, high, 9)]
+        
+        # The cropped region at preview size; upstream steps shared by all variants run once
+        state = self.snapshot_state()
+        recipe = state.recipe()
+        image = self.original
+        crops, _ = split_geometry(state.geometry_ops)
+        if crops:
+            x1, y1, x2, y2 = crop_rect(crops, image.shape)
+            image = image[y1:y2, x1:x2]
+            recipe = dict(recipe, masks=[dict(m, mask=m['mask'][y1:y2, x1:x2])
+                                         for m in recipe['masks']])
+        images = render_sweep(image, sweep_recipes(recipe, key, values))
+        
+        sheet, boxes = contact_sheet(images, [f"{key}: {v}" for v in values])
+        self.sweep_cells = list(zip(boxes, values))
+        self.sweep_photo = cv_to_tk(sheet)
+        self.sweep_label.config(image=self.sweep_photo)
+        self.sweep_label.image = self.sweep_photo
+
+    def pick_sweep_variant(self, event):
+        _, slider, _, _ = SWEEP_PARAMS[self.sweep_param.get()]
+        for (x1, y1, x2, y2), value in self.sweep_cells:
+            if x1 <= event.x < x2 and y1 <= event.y < y2:
+                # Same as dragging the slider there: renders and logs the edit
+                getattr(self, slider).set(value)
+                return
+
 # ---- DEFINE METHOD TO RESET FILTERS AND REVERT TO ORIGINAL IMAGE -----
     def reset_filters(self):
         # Clear history
@@ -1481,6 +1895,9 @@ class SnappicApp(tk.Tk):
         self.has_background_removed = False
         self.background_method = None
         
+        # Reset crop and resize steps
+        self.geometry_ops = []
+        
         # Reset UI controls
         if hasattr(self, 'gaussian_slider'):
             self.gaussian_slider.set(0)
@@ -1550,6 +1967,10 @@ class SnappicApp(tk.Tk):
         self.crop_end = None
         self.crop_rect = None
         
+        # Resetting is itself an undoable step
+        if self.original is not None:
+            self.edit_history.push("All filters reset", self.snapshot_state(), self.processed)
+        
 # ---- COMBINE ALL METHOD IN 'app' -----
 if __name__ == "__main__":
     app = SnappicApp()
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+import cv2
+import numpy as np
+from utils.history import EditHistory
+
+THUMBNAIL_SIZE = 96
+
+def make_thumbnail(image, size=THUMBNAIL_SIZE):
+    h, w = image.shape[:2]
+    scale = size / max(h, w)
+    return cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))),
+                      interpolation=cv2.INTER_AREA)
+
+def resident_bytes(image):
+    # Memory-mapped pixels live in the page cache, not in our budget
+    if image is None or isinstance(image, np.memmap):
+        return 0
+    return image.nbytes
+
+class ImageDocument:
+    # One open image with its own edit values, undo log and history lines
+    def __init__(self, path, original, history_budget):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.original = original
+        self.processed = original
+        self.state = None
+        self.log_lines = []
+        self.edit_history = EditHistory(memory_budget=history_budget)
+        self.thumbnail = make_thumbnail(original)
+        self.spill_paths = []
+
+    @property
+    def resident_bytes(self):
+        # Keyframes are often the very array processed is, count each once
+        arrays = [self.original, self.processed] + self.edit_history.memory_images()
+        return sum(resident_bytes(image) for image in {id(a): a for a in arrays}.values())
+
+    def update_thumbnail(self):
+        if self.processed is not None:
+            self.thumbnail = make_thumbnail(self.processed)
+
+    def _spill_array(self, image, folder):
+        path = os.path.join(folder, f"doc_{id(self)}_{len(self.spill_paths)}.npy")
+        np.save(path, np.ascontiguousarray(image))
+        self.spill_paths.append(path)
+
+        # Pages come back lazily the next time the pixels are touched
+        return np.load(path, mmap_mode="r")
+
+    def spill(self, folder):
+        # Swap the full resolution buffers for memory-mapped spill files
+        same = self.processed is self.original
+        if resident_bytes(self.original):
+            self.original = self._spill_array(self.original, folder)
+        if same:
+            self.processed = self.original
+        elif resident_bytes(self.processed):
+            self.processed = self._spill_array(self.processed, folder)
+        self.edit_history.release_memory()
+
+    def close(self):
+        self.original = None
+        self.processed = None
+        self.edit_history.close()
+        for path in self.spill_paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.spill_paths = []
+
+class Session:
+    # Open images under one RAM budget. The active image always stays in
+    # memory; the least recently used others are spilled first.
+    def __init__(self, memory_budget=2 * 2**30, history_budget=256 * 2**20, spill_dir=None):
+        self.memory_budget = memory_budget
+        self.history_budget = history_budget
+        self.spill_dir = spill_dir
+        self._own_spill_dir = False
+        self.documents = []
+        self.recent = []
+        self.active = None
+
+    def add(self, path, image):
+        doc = ImageDocument(path, image, self.history_budget)
+        self.documents.append(doc)
+        return doc
+
+    def activate(self, doc):
+        self.active = doc
+        if doc in self.recent:
+            self.recent.remove(doc)
+        self.recent.append(doc)
+        self.enforce_budget()
+        return doc
+
+    @property
+    def resident_bytes(self):
+        return sum(doc.resident_bytes for doc in self.documents)
+
+    def _folder(self):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="snappic_session_")
+            self._own_spill_dir = True
+        os.makedirs(self.spill_dir, exist_ok=True)
+        return self.spill_dir
+
+    def enforce_budget(self):
+        total = self.resident_bytes
+        for doc in list(self.recent):
+            if total <= self.memory_budget:
+                break
+            if doc is self.active or doc.resident_bytes == 0:
+                continue
+            before = doc.resident_bytes
+            doc.spill(self._folder())
+            total -= before - doc.resident_bytes
+
+    def close(self, doc):
+        if doc in self.documents:
+            self.documents.remove(doc)
+        if doc in self.recent:
+            self.recent.remove(doc)
+        if self.active is doc:
+            self.active = None
+        doc.close()
+
+    def shutdown(self):
+        for doc in list(self.documents):
+            self.close(doc)
+        if self._own_spill_dir and self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+            self._own_spill_dir = False
@@ -0,0 +1,144 @@
+from processing.pipeline import make_recipe, masks_key
+
+# Render stages in pipeline order and the edit values each one reads
+STAGES = (
+    ("blur", ("gaussian_value", "median_value", "mask_history")),
+    ("tone", ("darken_value", "brighten_value", "is_grayscale")),
+    ("bw", ("is_blackwhite", "bw_threshold")),
+    ("background", ("has_background_removed", "background_method", "bg_threshold")),
+    ("binary", ("show_binary",)),
+    ("geometry", ("geometry_ops",)),
+)
+
+# Kept for undo, but no stage renders differently because of it
+EXTRA_FIELDS = ("median_blur_used",)
+
+FIELDS = tuple(name for _, names in STAGES for name in names) + EXTRA_FIELDS
+
+DEFAULTS = {
+    'gaussian_value': 0, 'median_value': 0, 'mask_history': (),
+    'darken_value': 0, 'brighten_value': 0, 'is_grayscale': False,
+    'is_blackwhite': False, 'bw_threshold': 127,
+    'has_background_removed': False, 'background_method': None, 'bg_threshold': 240,
+    'show_binary': False, 'geometry_ops': (), 'median_blur_used': False,
+}
+
+_STAGE_OF = {name: i for i, (_, names) in enumerate(STAGES) for name in names}
+
+def _value_key(name, value):
+    # Hashable form of one edit value. Mask arrays and crop/resize steps are
+    # never changed in place, so the same mask arrays (held by the key) are
+    # the same masks.
+    if name == 'mask_history':
+        return masks_key(value)
+    if name == 'geometry_ops':
+        return tuple(tuple(sorted(op.items())) for op in value)
+    return value
+
+class EditState:
+    # All edit values of one image as an immutable value. replace() shares
+    # every unchanged field and stage key with the old state, so an edit
+    # costs one small object. Each stage keeps its key and hash, which makes
+    # ==, hash() and diff() a handful of comparisons.
+    __slots__ = FIELDS + ("_keys", "_hashes", "_hash", "_recipe")
+
+    def __init__(self, **values):
+        unknown = set(values) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown edit values: {', '.join(sorted(unknown))}")
+        for name in FIELDS:
+            value = values.get(name, DEFAULTS[name])
+            if isinstance(value, list):
+                value = tuple(value)
+            object.__setattr__(self, name, value)
+        keys = tuple(tuple(_value_key(n, getattr(self, n)) for n in names)
+                     for _, names in STAGES)
+        self._seal(keys)
+
+    def _seal(self, keys):
+        hashes = tuple(hash(key) for key in keys)
+        object.__setattr__(self, "_keys", keys)
+        object.__setattr__(self, "_hashes", hashes)
+        object.__setattr__(self, "_hash",
+                           hash((hashes, tuple(getattr(self, n) for n in EXTRA_FIELDS))))
+        object.__setattr__(self, "_recipe", None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("EditState is immutable, use replace()")
+
+    def replace(self, **changes):
+        # New state with changes applied, or self when nothing changed
+        changes = {n: tuple(v) if isinstance(v, list) else v for n, v in changes.items()}
+        changes = {n: v for n, v in changes.items() if getattr(self, n) is not v}
+        if not changes:
+            return self
+
+        new = object.__new__(EditState)
+        for name in FIELDS:
+            object.__setattr__(new, name, changes.get(name, getattr(self, name)))
+
+        # Only the stages whose values changed get a new key
+        touched = {_STAGE_OF[n] for n in changes if n in _STAGE_OF}
+        keys = tuple(tuple(_value_key(n, getattr(new, n)) for n in names) if i in touched
+                     else self._keys[i] for i, (_, names) in enumerate(STAGES))
+        new._seal(keys)
+        return new
+
+    def __eq__(self, other):
+        if not isinstance(other, EditState):
+            return NotImplemented
+        return (self._hash == other._hash and self._keys == other._keys
+                and all(getattr(self, n) == getattr(other, n) for n in EXTRA_FIELDS))
+
+    def __hash__(self):
+        return self._hash
+
+    def diff(self, other):
+        # Names of the stages whose values differ, in pipeline order. The
+        # first one and everything after it has to rerun.
+        return tuple(name for i, (name, _) in enumerate(STAGES)
+                     if self._keys[i] is not other._keys[i]
+                     and (self._hashes[i] != other._hashes[i] or self._keys[i] != other._keys[i]))
+
+    def stage_key(self, stage):
+        # Hash of everything up to and including stage, for caching its output
+        index = next(i for i, (name, _) in enumerate(STAGES) if name == stage)
+        return hash(self._hashes[:index + 1])
+
+    def recipe(self):
+        # Pipeline recipe of this state, built once
+        if self._recipe is None:
+            object.__setattr__(self, "_recipe", make_recipe(
+                gaussian=self.gaussian_value,
+                median=self.median_value,
+                masks=list(self.mask_history),
+                darken=self.darken_value,
+                brighten=self.brighten_value,
+                grayscale=self.is_grayscale,
+                blackwhite=self.is_blackwhite,
+                bw_threshold=self.bw_threshold,
+                background=self.background_method if self.has_background_removed else None,
+                bg_threshold=self.bg_threshold,
+                binary=self.show_binary,
+            ))
+        return self._recipe
+
+    def __repr__(self):
+        changed = ", ".join(f"{n}={getattr(self, n)!r}" for n in FIELDS
+                            if n != 'mask_history' and getattr(self, n) != DEFAULTS[n])
+        masks = f", {len(self.mask_history)} masks" if self.mask_history else ""
+        return f"EditState({changed}{masks})"
+
+class StateField:
+    # Attribute of an editor object that reads and writes one field of its
+    # EditState (kept in obj.edit_state), so plain assignments stay undoable
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        return getattr(obj.edit_state, self.name)
+
+    def __set__(self, obj, value):
+        obj.edit_state = obj.edit_state.replace(**{self.name: value})
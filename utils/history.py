@@ -0,0 +1,215 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+
+class _Keyframe:
+    # Rendered image of one history step, held in RAM or spilled to a .npy file
+    __slots__ = ("image", "path", "nbytes")
+
+    def __init__(self, image):
+        # Images are never modified in place, so keeping the reference is enough
+        self.image = image
+        self.path = None
+        self.nbytes = image.nbytes
+
+    @property
+    def in_memory(self):
+        return self.image is not None
+
+    def load(self):
+        if self.image is not None:
+            return self.image
+        return np.load(self.path)
+
+    def spill(self, folder):
+        self.path = os.path.join(folder, f"kf_{id(self)}.npy")
+        np.save(self.path, self.image)
+        self.image = None
+
+    def drop(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+        self.image = None
+        self.path = None
+
+class _Entry:
+    __slots__ = ("label", "state", "kind", "merge_key", "keyframe")
+
+    def __init__(self, label, state, kind, merge_key):
+        self.label = label
+        self.state = state
+        self.kind = kind
+        self.merge_key = merge_key
+        self.keyframe = None
+
+class EditHistory:
+    # Command log of edit states with cached keyframe renders.
+    # kind="param" steps need a full render, kind="geometry" steps (crop,
+    # resize) can be replayed on top of the previous step's image.
+    def __init__(self, memory_budget=512 * 2**20, disk_budget=2 * 2**30,
+                 max_entries=200, spill_dir=None):
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.max_entries = max_entries
+        self.spill_dir = spill_dir
+        self._own_spill_dir = False
+        self.entries = []
+        self.position = -1
+
+    def clear(self, label=None, state=None, image=None):
+        for entry in self.entries:
+            if entry.keyframe is not None:
+                entry.keyframe.drop()
+        self.entries = []
+        self.position = -1
+        if state is not None:
+            self.push(label, state, image)
+
+    def push(self, label, state, image=None, kind="param", merge_key=None):
+        # Drop the redo tail
+        for entry in self.entries[self.position + 1:]:
+            if entry.keyframe is not None:
+                entry.keyframe.drop()
+        del self.entries[self.position + 1:]
+
+        # Slider drags collapse into one step
+        top = self.entries[-1] if self.entries else None
+        if (merge_key is not None and top is not None and top.merge_key == merge_key
+                and len(self.entries) > 1):
+            if top.keyframe is not None:
+                top.keyframe.drop()
+            top.label = label
+            top.state = state
+            top.keyframe = None
+            entry = top
+        else:
+            entry = _Entry(label, state, kind, merge_key)
+            self.entries.append(entry)
+
+        if len(self.entries) > self.max_entries:
+            for old in self.entries[:-self.max_entries]:
+                if old.keyframe is not None:
+                    old.keyframe.drop()
+            del self.entries[:-self.max_entries]
+
+        self.position = len(self.entries) - 1
+        if image is not None:
+            entry.keyframe = _Keyframe(image)
+            self._enforce_budget()
+
+    @property
+    def current(self):
+        return self.entries[self.position] if self.position >= 0 else None
+
+    def can_undo(self):
+        return self.position > 0
+
+    def can_redo(self):
+        return self.position < len(self.entries) - 1
+
+    def undo(self, render, replay):
+        # Returns (entry, image) for the previous step
+        if not self.can_undo():
+            return None, None
+        return self._move_to(self.position - 1, render, replay)
+
+    def redo(self, render, replay):
+        if not self.can_redo():
+            return None, None
+        return self._move_to(self.position + 1, render, replay)
+
+    def _move_to(self, index, render, replay):
+        self.position = index
+        entry = self.entries[index]
+        image = self._checkout(index, render, replay)
+        if entry.keyframe is None:
+            entry.keyframe = _Keyframe(image)
+        self._enforce_budget()
+        return entry, image
+
+    def _checkout(self, index, render, replay):
+        # Walk back to the nearest keyframe reachable through geometry steps only
+        k = index
+        while k >= 0:
+            if self.entries[k].keyframe is not None:
+                break
+            if self.entries[k].kind != "geometry":
+                k = -1
+                break
+            k -= 1
+
+        if k < 0:
+            return render(self.entries[index].state)
+
+        image = self.entries[k].keyframe.load()
+        for step in range(k + 1, index + 1):
+            image = replay(image, self.entries[step - 1].state, self.entries[step].state)
+        return image
+
+    @property
+    def memory_bytes(self):
+        return sum(e.keyframe.nbytes for e in self.entries
+                   if e.keyframe is not None and e.keyframe.in_memory)
+
+    def memory_images(self):
+        # Keyframe images held in RAM
+        return [e.keyframe.image for e in self.entries
+                if e.keyframe is not None and e.keyframe.in_memory]
+
+    @property
+    def disk_bytes(self):
+        return sum(e.keyframe.nbytes for e in self.entries
+                   if e.keyframe is not None and not e.keyframe.in_memory)
+
+    def _folder(self):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="snappic_history_")
+            self._own_spill_dir = True
+        os.makedirs(self.spill_dir, exist_ok=True)
+        return self.spill_dir
+
+    def _enforce_budget(self):
+        # Farthest steps from the current position go first, the current one stays
+        keyed = [(abs(i - self.position), e) for i, e in enumerate(self.entries)
+                 if e.keyframe is not None and i != self.position]
+        keyed.sort(key=lambda item: item[0], reverse=True)
+
+        memory = self.memory_bytes
+        for _, entry in keyed:
+            if memory <= self.memory_budget:
+                break
+            if entry.keyframe.in_memory:
+                memory -= entry.keyframe.nbytes
+                if entry.keyframe.nbytes <= self.disk_budget:
+                    entry.keyframe.spill(self._folder())
+                else:
+                    entry.keyframe.drop()
+                    entry.keyframe = None
+
+        disk = self.disk_bytes
+        for _, entry in keyed:
+            if disk <= self.disk_budget:
+                break
+            if entry.keyframe is not None and not entry.keyframe.in_memory:
+                disk -= entry.keyframe.nbytes
+                entry.keyframe.drop()
+                entry.keyframe = None
+
+    def release_memory(self):
+        # Spill every keyframe, current one included (image is put away)
+        for entry in self.entries:
+            keyframe = entry.keyframe
+            if keyframe is not None and keyframe.in_memory:
+                if self.disk_bytes + keyframe.nbytes <= self.disk_budget:
+                    keyframe.spill(self._folder())
+                else:
+                    keyframe.drop()
+                    entry.keyframe = None
+
+    def close(self):
+        self.clear()
+        if self._own_spill_dir and self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+            self._own_spill_dir = False
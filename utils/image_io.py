@@ -2,14 +2,31 @@ import cv2
 from PIL import Image, ImageTk
 import numpy as np
 
-def load_image(path):
-    #load image
+def load_image(path, cache=None):
+    #load image, through the decoded-pixel cache when given one
+    if cache is not None:
+        return cache.load(path)
     return cv2.imread(path)
 
 def save_image(path, image):
     #save image
     cv2.imwrite(path, image)
 
+def decode_image(data):
+    # Decode encoded image bytes (JPG, PNG, ...) to BGR like load_image
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image data")
+    return image
+
+def encode_image(image, ext=".png"):
+    # Encode to bytes, ext picks the format
+    ok, buffer = cv2.imencode(ext, image)
+    if not ok:
+        raise ValueError(f"Could not encode image as {ext}")
+    return buffer.tobytes()
+
 def cv_to_tk(image):
     # Convert BGR to RGB
     if len(image.shape) == 3:
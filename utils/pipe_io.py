@@ -0,0 +1,70 @@
+import struct
+import cv2
+import numpy as np
+
+# A framed stream is any number of images, each one its byte length
+# (4 bytes, big-endian) followed by the encoded file. A zero length stands
+# for an image that could not be read or rendered, so the results stay in
+# step with the inputs.
+HEADER = struct.Struct(">I")
+
+def read_pipe(stream, framed=False):
+    # Decoded BGR images from a binary stream, None for any that cannot be
+    # decoded. Framed images are read into one buffer that only grows to the
+    # largest file seen, so a long stream runs in constant memory.
+    if not framed:
+        yield _decode(stream.read())
+        return
+
+    header = bytearray(HEADER.size)
+    buffer = bytearray()
+    while True:
+        if _read_exactly(stream, header, HEADER.size, allow_eof=True) is None:
+            return
+        size, = HEADER.unpack(header)
+        if size > len(buffer):
+            # A new buffer rather than a resize, a view of the old one may still be alive
+            buffer = bytearray(max(size, 2 * len(buffer)))
+        yield _decode(_read_exactly(stream, buffer, size)) if size else None
+
+def _read_exactly(stream, buffer, size, allow_eof=False):
+    view = memoryview(buffer)[:size]
+    got = 0
+    while got < size:
+        n = stream.readinto(view[got:])
+        if not n:
+            if allow_eof and got == 0:
+                return None
+            raise EOFError(f"Stream ended {size - got} bytes into a {size} byte frame")
+        got += n
+    return view
+
+def _decode(data):
+    if not len(data):
+        return None
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+class PipeWriter:
+    # Encodes results to a binary stream, framed or as one bare file
+    def __init__(self, stream, ext=".png", framed=False):
+        self.stream = stream
+        self.ext = ext
+        self.framed = framed
+
+    def write(self, image):
+        # Transparent results are always written as png
+        ext = ".png" if image.shape[-1:] == (4,) else self.ext
+        ok, buffer = cv2.imencode(ext, image)
+        if not ok:
+            raise ValueError(f"Could not encode image as {ext}")
+        if self.framed:
+            self.stream.write(HEADER.pack(len(buffer)))
+        # The encoded array goes out as is, no bytes copy
+        self.stream.write(buffer.data)
+        self.stream.flush()
+
+    def skip(self):
+        # Empty frame in place of an image that failed
+        if self.framed:
+            self.stream.write(HEADER.pack(0))
+            self.stream.flush()
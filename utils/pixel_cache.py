@@ -0,0 +1,55 @@
+import hashlib
+import os
+import tempfile
+import cv2
+import numpy as np
+from utils.result_cache import ResultCache
+
+def default_pixel_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "snappic", "pixels")
+
+class PixelCache(ResultCache):
+    # Decoded pixels as raw .npy files, reopened memory-mapped so pages
+    # load lazily. Keyed by path, mtime and size; same LRU byte cap as
+    # ResultCache. Small images decode fast enough and are not cached.
+    def __init__(self, folder=None, max_bytes=4 * 2**30, min_bytes=8 * 2**20):
+        super().__init__(folder or default_pixel_dir(), max_bytes)
+        self.min_bytes = min_bytes
+
+    def file_key(self, path):
+        stat = os.stat(path)
+        text = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}"
+        return hashlib.sha256(text.encode()).hexdigest() + ".npy"
+
+    def load(self, path):
+        key = self.file_key(path)
+        cached = os.path.join(self.folder, key)
+        with self.lock:
+            known = key in self.index
+        if known:
+            try:
+                # Read-only mapping, the filters never write into their input
+                image = np.load(cached, mmap_mode="r")
+                os.utime(cached)
+                with self.lock:
+                    self.index[key][1] = os.path.getmtime(cached)
+                    self.hits += 1
+                return image
+            except (OSError, ValueError):
+                with self.lock:
+                    self.index.pop(key, None)
+
+        with self.lock:
+            self.misses += 1
+        image = cv2.imread(path)
+        if image is None or image.nbytes < self.min_bytes or image.nbytes > self.max_bytes:
+            return image
+
+        # Temp file and rename, a crash never leaves a torn .npy behind
+        fd, tmp = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, image)
+        os.replace(tmp, cached)
+        self._track(key, os.path.getsize(cached))
+        return image
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import cv2
+import numpy as np
+from processing.pipeline import render_base, render_tail, background_mask
+from utils.image_io import encode_image
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "snappic", "results")
+
+def image_digest(image):
+    # Content hash of the pixels, shape and dtype
+    h = hashlib.sha256()
+    h.update(f"{image.shape}{image.dtype.str}".encode())
+    h.update(np.ascontiguousarray(image).data)
+    return h.hexdigest()
+
+def canonical_recipe(recipe, keys=None):
+    # Stable JSON for the recipe, mask arrays replaced by their content hash
+    values = {}
+    for key in sorted(keys or recipe):
+        value = recipe[key]
+        if key == "masks":
+            value = [[image_digest(m['mask']), m['blur_type'], m['intensity']] for m in value]
+        values[key] = value
+    return json.dumps(values, sort_keys=True, separators=(",", ":"))
+
+class ResultCache:
+    # Content-addressed files under a byte cap, least recently used evicted first
+    def __init__(self, folder=None, max_bytes=2 * 2**30):
+        self.folder = folder or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.folder, exist_ok=True)
+
+        # key -> [size, last use], rebuilt from the files of earlier runs
+        self.index = {}
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+            elif os.path.isfile(path):
+                stat = os.stat(path)
+                self.index[name] = [stat.st_size, stat.st_mtime]
+        self.total_bytes = sum(size for size, _ in self.index.values())
+
+    def key(self, digest, recipe, kind, keys=None, extra=""):
+        text = f"{digest}|{kind}|{extra}|{canonical_recipe(recipe, keys)}"
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get(self, key):
+        path = os.path.join(self.folder, key)
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self.lock:
+                self.index.pop(key, None)
+                self.misses += 1
+            return None
+
+        # The file time doubles as LRU stamp across runs. Another thread may
+        # have evicted the file since the read; the data is still good.
+        with self.lock:
+            try:
+                os.utime(path)
+                entry[1] = os.path.getmtime(path)
+            except OSError:
+                pass
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        # Write to a temp file and rename, readers never see half a file
+        fd, tmp = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, os.path.join(self.folder, key))
+        self._track(key, len(data))
+
+    def _track(self, key, size):
+        # Account for a file just written under key
+        with self.lock:
+            old = self.index.get(key)
+            if old is not None:
+                self.total_bytes -= old[0]
+            self.index[key] = [size, os.path.getmtime(os.path.join(self.folder, key))]
+            self.total_bytes += size
+            self._evict()
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for key, (size, _) in sorted(self.index.items(), key=lambda item: item[1][1]):
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.folder, key))
+            except FileNotFoundError:
+                pass
+            del self.index[key]
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "evictions": self.evictions, "entries": len(self.index),
+                    "bytes": self.total_bytes, "max_bytes": self.max_bytes}
+
+# Recipe values the segmentation mask depends on
+_MASK_KEYS = ("gaussian", "median", "masks", "darken", "brighten", "grayscale",
+              "blackwhite", "bw_threshold", "background")
+
+def is_png(data):
+    return data[:8] == b"\x89PNG\r\n\x1a\n"
+
+def render_cached(cache, image, recipe, ext=".png", digest=None):
+    # Encoded result of render(), with the output and the background mask
+    # looked up by content before doing any work. image may also be a
+    # callable that decodes it, so a hit skips decoding too (pass digest).
+    if digest is None:
+        if callable(image):
+            image = image()
+        digest = image_digest(image)
+    out_key = cache.key(digest, recipe, "output", extra=ext)
+    data = cache.get(out_key)
+    if data is not None:
+        return data
+
+    if callable(image):
+        image = image()
+
+    base = render_base(image, recipe)
+    mask = None
+    method = recipe["background"]
+    if method is not None:
+        extra = str(recipe["bg_threshold"]) if method == "simple" else ""
+        mask_key = cache.key(digest, recipe, "mask", _MASK_KEYS, extra)
+        mask_data = cache.get(mask_key)
+        if mask_data is not None:
+            mask = cv2.imdecode(np.frombuffer(mask_data, np.uint8), cv2.IMREAD_GRAYSCALE)
+        else:
+            mask = background_mask(base, method, recipe["bg_threshold"])
+            cache.put(mask_key, encode_image(mask, ".png"))
+
+    # Transparency forces PNG, check the result with is_png()
+    result = render_tail(base, recipe, mask)
+    if len(result.shape) == 3 and result.shape[2] == 4:
+        ext = ".png"
+    data = encode_image(result, ext)
+    cache.put(out_key, data)
+    return data
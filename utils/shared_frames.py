@@ -0,0 +1,132 @@
+import os
+import weakref
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+def _attach(name):
+    # Only the ring owner unlinks. Before 3.13 there is no track flag, but
+    # pool workers share the owner's resource tracker, so the extra
+    # registration is a no-op there.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+def frame_view(buf, shape, dtype, offset=0):
+    # ndarray over shared memory, no copy
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=buf, offset=offset)
+
+class FrameRing:
+    # Ring of reusable shared memory slots. Each slot has an input region
+    # and an output region of max_frame_bytes each.
+    def __init__(self, slots, max_frame_bytes):
+        self.max_frame_bytes = max_frame_bytes
+        self.blocks = [shared_memory.SharedMemory(create=True, size=2 * max_frame_bytes)
+                       for _ in range(slots)]
+        self.names = [b.name for b in self.blocks]
+
+        # Unlink even if the owner forgets to close
+        self._finalizer = weakref.finalize(self, FrameRing._unlink, list(self.blocks))
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def write_input(self, slot, image):
+        if image.nbytes > self.max_frame_bytes:
+            raise ValueError(f"Frame of {image.nbytes} bytes does not fit a "
+                             f"{self.max_frame_bytes} byte slot")
+        view = frame_view(self.blocks[slot].buf, image.shape, image.dtype)
+        view[...] = image
+        return (self.names[slot], image.shape, image.dtype.str)
+
+    def output_view(self, slot, shape, dtype):
+        return frame_view(self.blocks[slot].buf, shape, dtype, self.max_frame_bytes)
+
+    @staticmethod
+    def _unlink(blocks):
+        for block in blocks:
+            try:
+                block.close()
+                block.unlink()
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        self._finalizer()
+
+# End of the input images; None is a frame that could not be decoded
+_END = object()
+
+# Per worker process: slot name -> attached block
+_attached = {}
+
+def _run_in_slot(func, ref, max_frame_bytes, args):
+    # Worker side: input and output are views into the shared slot
+    name, shape, dtype = ref
+    block = _attached.get(name)
+    if block is None:
+        block = _attached[name] = _attach(name)
+
+    result = func(frame_view(block.buf, shape, dtype), *args)
+    if result.nbytes > max_frame_bytes:
+        raise ValueError("Result does not fit the output region")
+    frame_view(block.buf, result.shape, result.dtype, max_frame_bytes)[...] = result
+    return result.shape, result.dtype.str
+
+class SharedFramePool:
+    # Process pool that moves frames through shared memory instead of
+    # pickling them. func(image, *args) must be a module level function.
+    def __init__(self, max_frame_bytes, processes=None, slots=None):
+        self.processes = processes or os.cpu_count() or 1
+        self.ring = FrameRing(slots or self.processes * 2, max_frame_bytes)
+        self.pool = ProcessPoolExecutor(self.processes)
+
+    def imap(self, func, images, *args):
+        # Yields results in order. Each result is a view into its slot and
+        # stays valid only until the next one is requested; copy to keep it.
+        # A None image (one that could not be decoded) is skipped and yields
+        # None in its place, the frames after it still run.
+        images = iter(images)
+        free = deque(range(len(self.ring)))
+        pending = deque()
+        held = None
+
+        while True:
+            while free:
+                image = next(images, _END)
+                if image is _END:
+                    break
+                if image is None:
+                    pending.append((None, None))
+                    continue
+                slot = free.popleft()
+                ref = self.ring.write_input(slot, image)
+                future = self.pool.submit(_run_in_slot, func, ref,
+                                          self.ring.max_frame_bytes, args)
+                pending.append((slot, future))
+
+            if held is not None:
+                free.append(held)
+                held = None
+            if not pending:
+                return
+
+            slot, future = pending.popleft()
+            if future is None:
+                yield None
+                continue
+            shape, dtype = future.result()
+            held = slot
+            yield self.ring.output_view(slot, shape, dtype)
+
+    def close(self):
+        self.pool.shutdown()
+        self.ring.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
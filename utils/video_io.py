@@ -0,0 +1,88 @@
+import os
+import cv2
+
+FRAME_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+def list_frame_files(folder):
+    # Sorted so numbered time-lapse frames come out in order
+    names = sorted(n for n in os.listdir(folder) if n.lower().endswith(FRAME_EXTENSIONS))
+    return [os.path.join(folder, n) for n in names]
+
+def read_frames(source):
+    # Yield BGR frames from a video file or a folder of stills
+    if os.path.isdir(source):
+        for path in list_frame_files(source):
+            frame = cv2.imread(path)
+            if frame is not None:
+                yield frame
+        return
+
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise IOError(f"Cannot open video: {source}")
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield frame
+    finally:
+        capture.release()
+
+def source_fps(source, default=25.0):
+    if os.path.isdir(source):
+        return default
+
+    capture = cv2.VideoCapture(source)
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    capture.release()
+    return fps if fps and fps > 0 else default
+
+class VideoSink:
+    # Writes frames with cv2.VideoWriter, opened on the first frame's size
+    def __init__(self, path, fps=25.0, fourcc="mp4v"):
+        self.path = path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.writer = None
+
+    def write(self, frame):
+        # Video containers have no alpha or single channel frames
+        if len(frame.shape) == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        elif frame.shape[2] == 4:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+
+        if self.writer is None:
+            h, w = frame.shape[:2]
+            self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc),
+                                          self.fps, (w, h))
+            if not self.writer.isOpened():
+                raise IOError(f"Cannot open video writer: {self.path}")
+        self.writer.write(frame)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+class FrameDirSink:
+    # Writes numbered stills, PNG keeps transparency from background removal
+    def __init__(self, folder, pattern="frame_{:06d}.png"):
+        self.folder = folder
+        self.pattern = pattern
+        self.count = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def write(self, frame):
+        cv2.imwrite(os.path.join(self.folder, self.pattern.format(self.count)), frame)
+        self.count += 1
+
+    def close(self):
+        pass
+
+def open_sink(destination, fps=25.0):
+    # A path with a video extension becomes a video, anything else a frame folder
+    if os.path.splitext(destination)[1].lower() in (".mp4", ".avi", ".mov", ".mkv"):
+        return VideoSink(destination, fps)
+    return FrameDirSink(destination)